@@ -0,0 +1,92 @@
+"""Списки админки на большой таблице постов: прежние настройки и нынешние.
+
+python benchmarks/admin.py [постов]  (по умолчанию 1 000 000)
+"""
+import sys
+import time
+
+from common import make_posts, setup, teardown, timed
+
+PAGES = (
+    ("первая страница", "/admin/posts/post/", {}),
+    ("середина списка", "/admin/posts/post/", {"p": None}),
+    ("поиск по id", "/admin/posts/post/", {"q": "12345"}),
+    ("поиск @автор", "/admin/posts/post/", {"q": "@bench3"}),
+    ("за год", "/admin/posts/post/", {"pub_date__year": 2020}),
+    ("комментарии", "/admin/posts/comment/", {}),
+)
+
+
+def old_settings(model_admin):
+    """Настройки админки постов до оптимизации."""
+    from django.contrib import admin
+    from django.core.paginator import Paginator
+
+    model_admin.list_select_related = False
+    model_admin.paginator = Paginator
+    model_admin.show_full_result_count = True
+    model_admin.change_list_template = "admin/change_list.html"
+    model_admin.get_search_results = (
+        lambda *args: admin.ModelAdmin.get_search_results(model_admin, *args))
+
+
+def run(client, count):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for title, url, params in PAGES:
+        if "p" in params:
+            # страницы в админке по 100 строк
+            params = {"p": count // 200}
+        with CaptureQueriesContext(connection) as queries:
+            response, median, p95 = timed(lambda: client.get(url, params),
+                                          repeat=5)
+        assert response.status_code == 200, response.status_code
+        print(f"  {title:<18}{len(queries) // 5:>9}"
+              f"{median:>13.1f}{p95:>9.1f}")
+
+
+def main(count):
+    old_config = setup(CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+    try:
+        from django.contrib import admin
+        from django.contrib.auth import get_user_model
+        from django.db import connection
+        from django.test import Client
+        from posts.models import Comment, Post
+
+        started = time.perf_counter()
+        users, _ = make_posts(count, authors=100)
+        # даты размазаны на годы назад, по минуте на пост (SQLite)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE posts_post SET pub_date = "
+                           "datetime('2021-01-01', '-' || id || ' minutes')")
+        Comment.objects.bulk_create(
+            Comment(post_id=pk, author=users[pk % len(users)], text="ok")
+            for pk in Post.objects.values_list("pk", flat=True)[:50000])
+        print(f"данные: {count} постов за "
+              f"{time.perf_counter() - started:.0f} с")
+
+        admin_user = get_user_model().objects.create_superuser(
+            "root", "root@yatube.ru", "12345")
+        client = Client()
+        client.force_login(admin_user)
+
+        header = (f"  {'страница':<18}{'запросов':>9}"
+                  f"{'медиана, мс':>13}{'p95, мс':>9}")
+        print("сейчас:")
+        print(header)
+        run(client, count)
+
+        for model in (Post, Comment):
+            old_settings(admin.site._registry[model])
+        print("как было:")
+        print(header)
+        run(client, count)
+    finally:
+        teardown(old_config)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
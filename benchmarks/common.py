@@ -0,0 +1,78 @@
+"""Общая обвязка для бенчмарков: Django + временная тестовая база.
+
+Запуск из корня проекта: python benchmarks/<имя>.py
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(database_file=False, **settings_overrides):
+    """database_file=True - база во временном файле, а не в памяти:
+    нужно, когда в неё пишут из нескольких потоков."""
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+    import django
+    from django.conf import settings
+    django.setup()
+    for name, value in settings_overrides.items():
+        setattr(settings, name, value)
+    settings.ALLOWED_HOSTS = ["*"]
+    if database_file:
+        from django.db import connections
+        database = connections["default"].settings_dict
+        database["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(),
+                                                "bench.sqlite3")
+        database["OPTIONS"]["timeout"] = 30
+
+    from django.test.utils import (setup_databases,
+                                   setup_test_environment)
+    setup_test_environment()
+    return setup_databases(verbosity=0, interactive=False)
+
+
+def teardown(old_config):
+    from django.test.utils import (teardown_databases,
+                                   teardown_test_environment)
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
+
+
+def timed(func, repeat=50):
+    """Гоняет func repeat раз, возвращает (результат, медиана, p95) в мс."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return result, statistics.median(samples), p95
+
+
+def make_posts(count, authors=10, groups=3, text=None):
+    from django.contrib.auth import get_user_model
+    from posts.models import Group, Post
+
+    User = get_user_model()
+    users = [User.objects.create_user(username=f"bench{i}")
+             for i in range(authors)]
+    group_objs = [Group.objects.create(title=f"group {i}", slug=f"g{i}",
+                                       description="bench")
+                  for i in range(groups)]
+    text = text or ("Lorem ipsum dolor sit amet, consectetur adipiscing "
+                    "elit, sed do eiusmod tempor incididunt.\n") * 3
+    batch = []
+    for i in range(count):
+        batch.append(Post(text=f"{i} {text}", author=users[i % authors],
+                          group=group_objs[i % groups]))
+        if len(batch) == 5000:
+            Post.objects.bulk_create(batch)
+            batch = []
+    Post.objects.bulk_create(batch)
+    return users, group_objs
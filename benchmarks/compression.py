@@ -0,0 +1,43 @@
+"""Сравнение размера и времени ответа лент с сжатием и без.
+
+python benchmarks/compression.py [уровень ...]
+"""
+import sys
+
+from common import make_posts, setup, teardown, timed
+
+PAGES = ("/", "/bench0/", "/group/g0/")
+
+
+def main(levels):
+    old_config = setup(CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+    try:
+        from django.conf import settings
+        from django.test import Client
+
+        make_posts(200)
+        client = Client()
+        print(f"{'страница':<12}{'уровень':>8}{'байт':>10}{'сжатие':>9}"
+              f"{'медиана, мс':>13}{'p95, мс':>9}")
+        for url in PAGES:
+            response, median, p95 = timed(lambda: client.get(url))
+            plain = len(response.content)
+            print(f"{url:<12}{'-':>8}{plain:>10}{'1.00':>9}"
+                  f"{median:>13.2f}{p95:>9.2f}")
+            for level in levels:
+                settings.GZIP_LEVEL = level
+                # middleware создаётся заново под новый уровень
+                client.handler.load_middleware()
+                response, median, p95 = timed(
+                    lambda: client.get(url, HTTP_ACCEPT_ENCODING="gzip"))
+                size = len(response.content)
+                print(f"{url:<12}{level:>8}{size:>10}{plain / size:>9.2f}"
+                      f"{median:>13.2f}{p95:>9.2f}  "
+                      f"{response.get('Server-Timing', '')}")
+    finally:
+        teardown(old_config)
+
+
+if __name__ == "__main__":
+    main([int(level) for level in sys.argv[1:]] or [1, 6, 9])
@@ -0,0 +1,92 @@
+"""Нагрузочный тест подписок: потоки одновременно жмут «подписаться» и
+«отписаться» на одних и тех же авторов.
+
+Сравниваются get_or_create + get/delete (как было) и follows.follow /
+follows.unfollow (один запрос на клик). Считаются ошибки, лишние строки
+и пропускная способность.
+
+python benchmarks/follow.py [кликов на поток]
+"""
+import sys
+import threading
+import time
+
+from common import setup, teardown
+
+THREADS = 8
+AUTHORS = 5
+
+
+def legacy_follow(user, author):
+    from posts.models import Follow
+    Follow.objects.get_or_create(user=user, author=author)
+
+
+def legacy_unfollow(user, author):
+    from posts.models import Follow
+    follow = Follow.objects.get(author=author, user=user)
+    if Follow.objects.filter(pk=follow.pk).exists():
+        follow.delete()
+
+
+def run(follow, unfollow, clicks, reader, authors):
+    from django.db import connection
+    from posts.models import Follow
+
+    Follow.objects.all().delete()
+    errors = []
+    barrier = threading.Barrier(THREADS)
+
+    def worker(number):
+        barrier.wait()
+        for i in range(clicks):
+            author = authors[(number + i) % len(authors)]
+            action = follow if (i // len(authors)) % 2 == 0 else unfollow
+            try:
+                action(reader, author)
+            except Exception as error:
+                errors.append(type(error).__name__)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    rows = Follow.objects.filter(user=reader).count()
+    pairs = (Follow.objects.filter(user=reader)
+             .values("author").distinct().count())
+    return THREADS * clicks / elapsed, errors, rows - pairs
+
+
+def main(clicks):
+    old_config = setup(database_file=True)
+    try:
+        from django.contrib.auth import get_user_model
+        from posts import follows
+
+        User = get_user_model()
+        reader = User.objects.create_user(username="reader")
+        authors = [User.objects.create_user(username=f"author{i}")
+                   for i in range(AUTHORS)]
+
+        print(f"{THREADS} потоков по {clicks} кликов, {AUTHORS} авторов")
+        print(f"  {'способ':<16}{'кликов/с':>10}{'ошибок':>8}{'дублей':>8}")
+        for name, follow, unfollow in (
+                ("get_or_create", legacy_follow, legacy_unfollow),
+                ("follows", follows.follow, follows.unfollow)):
+            rate, errors, duplicates = run(follow, unfollow, clicks,
+                                           reader, authors)
+            print(f"  {name:<16}{rate:>10.0f}{len(errors):>8}"
+                  f"{duplicates:>8}")
+            for error in sorted(set(errors)):
+                print(f"    {error}: {errors.count(error)}")
+    finally:
+        teardown(old_config)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,101 @@
+"""Нагрузочный тест лимитов на запись: один скрипт-спамер против обычных
+пользователей, с лимитами и без.
+
+python benchmarks/ratelimit.py [запросов спамера]
+"""
+import logging
+import statistics
+import sys
+import threading
+import time
+
+from common import setup, teardown
+
+NORMAL_USERS = 4
+NORMAL_POSTS = 5
+
+
+def run(abuse_requests):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+
+    User = get_user_model()
+    results = {}
+
+    def actor(name, count, pause, ip):
+        client = Client(REMOTE_ADDR=ip)
+        client.force_login(User.objects.get(username=name))
+        stats = {"ok": 0, "limited": 0, "errors": 0, "latency": []}
+        for i in range(count):
+            started = time.perf_counter()
+            try:
+                response = client.post("/new/", {"text": f"{name} {i}"})
+                status = response.status_code
+            except Exception:
+                status = 500
+            stats["latency"].append((time.perf_counter() - started) * 1000)
+            if status == 302:
+                stats["ok"] += 1
+            elif status == 429:
+                stats["limited"] += 1
+            else:
+                stats["errors"] += 1
+            time.sleep(pause)
+        results[name] = stats
+        connection.close()
+
+    threads = [threading.Thread(target=actor,
+                                args=("abuser", abuse_requests, 0,
+                                      "10.0.0.1"))]
+    threads += [threading.Thread(target=actor,
+                                 args=(f"user{i}", NORMAL_POSTS, 0.05,
+                                       f"10.0.1.{i}"))
+                for i in range(NORMAL_USERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(title, results):
+    print(title)
+    print(f"  {'кто':<8}{'записано':>10}{'429':>6}{'ошибок':>8}"
+          f"{'медиана, мс':>13}{'p95, мс':>9}")
+    for name, stats in sorted(results.items()):
+        latency = sorted(stats["latency"])
+        p95 = latency[min(len(latency) - 1, int(len(latency) * 0.95))]
+        print(f"  {name:<8}{stats['ok']:>10}{stats['limited']:>6}"
+              f"{stats['errors']:>8}{statistics.median(latency):>13.2f}"
+              f"{p95:>9.2f}")
+
+
+def main(abuse_requests):
+    old_config = setup(database_file=True, CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "bench-ratelimit"}})
+    # 429 сыплются в лог django.request предупреждениями
+    logging.getLogger("django.request").setLevel(logging.ERROR)
+    try:
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+
+        User = get_user_model()
+        User.objects.create_user(username="abuser")
+        for i in range(NORMAL_USERS):
+            User.objects.create_user(username=f"user{i}")
+
+        limits = settings.RATELIMITS
+        settings.RATELIMITS = {}
+        report("без лимитов:", run(abuse_requests))
+        settings.RATELIMITS = limits
+        cache.clear()
+        report(f"с лимитами {limits['new_post']}:", run(abuse_requests))
+    finally:
+        teardown(old_config)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
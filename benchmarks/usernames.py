@@ -0,0 +1,50 @@
+"""Автодополнение имён: username LIKE 'pre%' против индекса в памяти.
+
+python benchmarks/usernames.py [пользователей]
+"""
+import random
+import string
+import sys
+
+from common import setup, teardown, timed
+
+
+def main(count):
+    old_config = setup()
+    try:
+        from django.contrib.auth import get_user_model
+        from users.usernames import index
+
+        User = get_user_model()
+        rng = random.Random(0)
+        names = {"".join(rng.choices(string.ascii_lowercase,
+                                     k=rng.randint(5, 12)))
+                 for _ in range(count)}
+        User.objects.bulk_create([User(username=name) for name in names],
+                                 batch_size=400)
+        prefixes = ["".join(rng.choices(string.ascii_lowercase, k=2))
+                    for _ in range(50)]
+
+        def like():
+            return [list(User.objects
+                         .filter(username__istartswith=prefix)
+                         .order_by("username")
+                         .values_list("username", flat=True)[:10])
+                    for prefix in prefixes]
+
+        def bisect():
+            return [index.search(prefix, 10) for prefix in prefixes]
+
+        _, build, _ = timed(lambda: index.rebuild(0), repeat=3)
+        print(f"{len(names)} имён, индекс строится за {build:.0f} мс")
+        for title, func in (("LIKE", like), ("bisect", bisect)):
+            _, median, p95 = timed(func, repeat=20)
+            print(f"  {title:<8} на запрос: медиана "
+                  f"{median / len(prefixes):.3f} мс, "
+                  f"p95 {p95 / len(prefixes):.3f} мс")
+    finally:
+        teardown(old_config)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
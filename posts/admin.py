@@ -1,14 +1,144 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Max
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
-from .models import Comment, Follow, Group, Post
+from .bulk import enqueue_bulk
+from .follows import delete_follows
+from .models import Comment, Follow, Group, Job, Post
+
+User = get_user_model()
+
+
+def estimated_row_count(model):
+    """Примерное число строк без COUNT(*) по всей таблице.
+
+    В PostgreSQL берём статистику планировщика, в остальных базах -
+    максимальный первичный ключ, он читается из индекса за O(log n).
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    return model._default_manager.aggregate(last=Max("pk"))["last"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц: точный счёт только до предела.
+
+    Без фильтров число строк оценивается, с фильтрами считается
+    не больше ADMIN_EXACT_COUNT_LIMIT строк - дальше страницы
+    всё равно никто не листает.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate > limit:
+                return estimate
+        return queryset[:limit].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Общие настройки списков для таблиц на миллионы строк.
+
+    Поиск: число ищется по id_search_field, «@имя» - по точному имени
+    автора; оба поиска идут по индексу. Остальное - обычный поиск по
+    search_fields.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    id_search_field = "pk"
+    empty_value_display = "-пусто-"
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.isdigit():
+            return queryset.filter(**{self.id_search_field: term}), False
+        if term.startswith("@") and len(term) > 1:
+            return queryset.filter(author__username=term[1:]), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class BulkActionForm(ActionForm):
+    author = forms.CharField(required=False, label="Автор (имя)")
+
+
+class PostActionForm(BulkActionForm):
+    group = forms.ModelChoiceField(Group.objects.all(), required=False,
+                                   label="Сообщество")
+
+
+class BulkActionsAdmin(LargeTableAdmin):
+    """Массовые действия выполняются фоновой задачей по пачкам.
+
+    Стандартное удаление заменено: оно грузит все строки в память
+    и удаляет их одной транзакцией.
+    """
+    action_form = BulkActionForm
+    actions = ("delete_in_background", "reassign_author")
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def start_job(self, request, queryset, operation, value=None):
+        job = enqueue_bulk(queryset, operation, value)
+        url = reverse("admin:posts_job_change", args=(job.pk,))
+        self.message_user(request, format_html(
+            'Задача <a href="{}">{}</a> поставлена в очередь.', url, job))
+
+    def delete_in_background(self, request, queryset):
+        self.start_job(request, queryset, "delete")
+    delete_in_background.short_description = "Удалить (в фоне)"
+
+    def reassign_author(self, request, queryset):
+        username = request.POST.get("author", "").strip()
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            self.message_user(request, f"Нет пользователя «{username}».",
+                              messages.ERROR)
+            return
+        self.start_job(request, queryset, "author", author.pk)
+    reassign_author.short_description = "Сменить автора (в фоне)"
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(BulkActionsAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group",)
+    list_select_related = ("author", "group")
     search_fields = ("text",)
     list_filter = ("pub_date",)
-    empty_value_display = "-пусто-"
+    date_hierarchy = "pub_date"
+    autocomplete_fields = ("author", "group")
+    action_form = PostActionForm
+    actions = BulkActionsAdmin.actions + ("move_to_group",)
+
+    def save_model(self, request, obj, form, change):
+        obj.save_edits()
+
+    def move_to_group(self, request, queryset):
+        group = Group.objects.filter(pk=request.POST.get("group") or None)
+        if not group.exists():
+            self.message_user(request, "Выберите сообщество.",
+                              messages.ERROR)
+            return
+        self.start_job(request, queryset, "group", group.get().pk)
+    move_to_group.short_description = "Перенести в сообщество (в фоне)"
 
 
 @admin.register(Group)
@@ -20,13 +150,44 @@ class GroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(BulkActionsAdmin):
     list_display = ("pk", "post", "author", "text", "created")
-    search_fields = ("post",)
-    list_filter = ("post",)
-    empty_value_display = "-пусто-"
+    list_select_related = ("post", "author")
+    # число в поиске - id поста
+    id_search_field = "post_id"
+    search_fields = ("text",)
+    list_filter = ("created",)
+    date_hierarchy = "created"
+    raw_id_fields = ("post",)
+    autocomplete_fields = ("author",)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ("user", "author")
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
+
+    # отписка должна сбросить кэши, как и через unfollow()
+    def delete_model(self, request, obj):
+        delete_follows(Follow.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_follows(queryset)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("pk", "kind", "status", "progress_display", "processed",
+                    "total", "created", "updated")
+    list_filter = ("status", "kind")
+    readonly_fields = ("kind", "status", "progress_display", "cursor",
+                       "processed", "total", "error", "created", "updated")
+    exclude = ("payload",)
+
+    def progress_display(self, job):
+        return "-" if job.progress is None else f"{job.progress}%"
+    progress_display.short_description = "Прогресс"
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,115 @@
+import zlib
+
+from django.db import transaction
+from django.http import Http404
+
+from .models import (ArchivedComment, ArchivedPost, Comment, Notification,
+                     Post)
+from .queries import with_comment_count
+from .shards import each_shard
+from .stats import stats_frozen
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+class ChainedPostList:
+    """Горячие посты, а за ними холодные - как один список для Paginator.
+
+    Срез сначала берётся из первого queryset'а, остаток - из следующих,
+    поэтому холодная таблица читается только на последних страницах.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        result = []
+        for queryset, size in zip(self.querysets, self.counts()):
+            if stop is not None and stop <= 0:
+                break
+            if start < size:
+                end = size if stop is None else min(stop, size)
+                result.extend(queryset[start:end])
+            start = max(start - size, 0)
+            if stop is not None:
+                stop -= size
+        return result
+
+
+def get_post_or_archived(queryset=None, **lookup):
+    """Ищет пост в горячей таблице, а если его там нет - в архиве."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    try:
+        return queryset.get(**lookup)
+    except Post.DoesNotExist:
+        pass
+    try:
+        return with_comment_count(ArchivedPost.objects.select_related(
+            'author', 'group')).get(**lookup)
+    except ArchivedPost.DoesNotExist:
+        raise Http404
+
+
+def archive_batch(cutoff, compress=False, batch_size=ARCHIVE_BATCH_SIZE):
+    """Переносит в архив пачку постов старше cutoff вместе с комментариями.
+
+    Пачка берётся с первой базы, где такие посты есть (архив - в default).
+    Возвращает число перенесённых постов, 0 - переносить больше нечего.
+    """
+    for queryset in each_shard(Post.objects.all()):
+        moved = archive_from(queryset, cutoff, compress, batch_size)
+        if moved:
+            return moved
+    return 0
+
+
+def archive_from(queryset, cutoff, compress, batch_size):
+    db = queryset.db
+    with transaction.atomic(using=db), transaction.atomic():
+        posts = list(queryset.filter(pub_date__lt=cutoff)
+                     .order_by('pk')[:batch_size])
+        if not posts:
+            return 0
+        ids = [post.pk for post in posts]
+        archived = []
+        for post in posts:
+            item = ArchivedPost(id=post.pk, pub_date=post.pub_date,
+                                author_id=post.author_id,
+                                group_id=post.group_id,
+                                image=post.image.name or None,
+                                views=post.views)
+            if compress:
+                item.compressed_text = zlib.compress(post.text.encode())
+            else:
+                item.raw_text = post.text
+            archived.append(item)
+        # пост, ещё не удалённый со старого шарда после переезда автора,
+        # уже в архиве: повтор пропускаем
+        ArchivedPost.objects.bulk_create(archived, ignore_conflicts=True)
+        ArchivedComment.objects.bulk_create(
+            (ArchivedComment(id=comment.pk, post_id=comment.post_id,
+                             author_id=comment.author_id, text=comment.text,
+                             created=comment.created)
+             for comment in Comment.objects.using(db).filter(
+                 post_id__in=ids)),
+            ignore_conflicts=True)
+        # уведомления в default: каскад с шарда до них не дойдёт
+        Notification.objects.filter(post_id__in=ids).delete()
+        with stats_frozen():
+            Post.objects.using(db).filter(pk__in=ids).delete()
+    return len(posts)
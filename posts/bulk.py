@@ -0,0 +1,101 @@
+import base64
+import pickle
+
+from django.core.cache import cache
+
+from . import edge, sitemap
+from .jobs import enqueue, handler
+from .models import Comment, Post
+from .queries import author_sidebar_key
+from .stats import apply_deltas, post_deltas, stats_frozen
+
+MODELS = {"post": Post, "comment": Comment}
+
+# операция -> поле, которое она меняет (None - удаление)
+OPERATIONS = {"delete": None, "group": "group_id", "author": "author_id"}
+
+
+def enqueue_bulk(queryset, operation, value=None):
+    """Ставит массовую правку выбранных строк в очередь задач.
+
+    Запоминается только условие выборки (pickle от queryset.query, как
+    советует документация Django): ни id, ни счёт строк в запросе
+    админки не нужны. Считает и идёт по строкам сама задача.
+    """
+    model = {model: name for name, model in MODELS.items()}[queryset.model]
+    query = base64.b64encode(pickle.dumps(queryset.order_by().query))
+    return enqueue("admin_bulk", model=model, operation=operation,
+                   value=value, query=query.decode())
+
+
+def selected(payload):
+    model = MODELS[payload["model"]]
+    queryset = model.objects.all()
+    queryset.query = pickle.loads(base64.b64decode(payload["query"]))
+    return queryset
+
+
+def invalidate(model, rows):
+    """Сбрасывает кэши страниц, задетых правкой пачки через update().
+
+    update() идёт мимо сигналов, поэтому ключи собираем сами.
+    rows - (pk, group_id или post_id, author_id) до и после правки.
+    """
+    keys = set()
+    authors = set()
+    for pk, parent_id, author_id in rows:
+        authors.add(author_id)
+        if model is Comment:
+            keys.add(f"post-{parent_id}")
+            continue
+        keys.update(("index", f"post-{pk}", f"author-{author_id}"))
+        if parent_id is not None:
+            keys.add(f"group-{parent_id}")
+    if model is Post:
+        cache.delete_many([author_sidebar_key(author_id)
+                           for author_id in authors])
+    edge.invalidate(*sorted(keys))
+
+
+@handler("admin_bulk")
+def admin_bulk(job, payload, batch_size):
+    """Одна пачка массовой правки: строки после курсора по pk."""
+    queryset = selected(payload)
+    if job.total is None:
+        job.total = queryset.count()
+    batch = list(queryset.filter(pk__gt=job.cursor).order_by("pk")
+                 .values_list("pk", flat=True)[:batch_size])
+    if not batch:
+        return 0
+    model = queryset.model
+    queryset = model.objects.filter(pk__in=batch)
+    field = OPERATIONS[payload["operation"]]
+    columns = ("pk", "group_id" if model is Post else "post_id",
+               "author_id")
+
+    if field is None:
+        if model is Post:
+            # счётчики сообществ правим разом на пачку, а не сигналами
+            deltas = post_deltas(
+                queryset.values_list("group_id", "author_id"), -1)
+            with stats_frozen():
+                queryset.delete()
+            apply_deltas(deltas)
+        else:
+            queryset.delete()
+    else:
+        before = list(queryset.values_list(*columns))
+        queryset.update(**{field: payload["value"]})
+        after = list(queryset.values_list(*columns))
+        if model is Post:
+            deltas = post_deltas([row[1:] for row in before], -1)
+            deltas.update(post_deltas([row[1:] for row in after], 1))
+            apply_deltas(deltas)
+            if field == "author_id":
+                # в адресе поста имя автора
+                for pk in {sitemap.shard_of(pk): pk for pk in batch}.values():
+                    sitemap.mark_dirty(pk)
+        invalidate(model, before + after)
+
+    job.cursor = batch[-1]
+    return len(batch)
@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Post
+from .shards import all_aliases, is_sharded
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """Просмотры постов, накопленные в памяти воркера.
+
+    Каждый просмотр - только инкремент словаря под блокировкой; в базу
+    счётчики уходят одним UPDATE ... CASE, когда накопилось
+    VIEW_FLUSH_EVERY просмотров или прошло VIEW_FLUSH_INTERVAL секунд.
+    При остановке или падении воркера теряется не больше
+    VIEW_FLUSH_EVERY просмотров.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.hits = 0
+        self.flushed_at = time.monotonic()
+
+    def add(self, post_id):
+        with self.lock:
+            self.pending[post_id] += 1
+            self.hits += 1
+            due = (self.hits >= settings.VIEW_FLUSH_EVERY
+                   or time.monotonic() - self.flushed_at
+                   >= settings.VIEW_FLUSH_INTERVAL)
+        if due:
+            self.flush_quietly()
+
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.hits = 0
+            self.flushed_at = time.monotonic()
+        return pending
+
+    def flush(self):
+        """Пишет накопленное в базу; возвращает число постов."""
+        pending = self.take()
+        if not pending:
+            return 0
+        try:
+            increment = Case(
+                *(When(pk=post_id, then=Value(count))
+                  for post_id, count in pending.items()),
+                default=Value(0), output_field=IntegerField())
+            aliases = all_aliases() if is_sharded() else [None]
+            for alias in aliases:
+                Post.objects.db_manager(alias).filter(
+                    pk__in=list(pending)).update(views=F("views") + increment)
+        except Exception:
+            # база недоступна - вернём просмотры в буфер до следующей попытки
+            with self.lock:
+                self.pending.update(pending)
+                self.hits += sum(pending.values())
+            raise
+        return len(pending)
+
+    def flush_quietly(self):
+        # из-за счётчика страница поста падать не должна
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception("Не удалось записать просмотры")
+            return 0
+
+
+views = ViewCounter()
+
+
+def record_view(post_id):
+    views.add(post_id)
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Follow, Post
+from .shards import authors_by_shard
+
+User = get_user_model()
+
+PERIODS = {"daily": timedelta(days=1), "weekly": timedelta(weeks=1)}
+
+
+def recipient_chunks(chunk_size):
+    """Активные пользователи с почтой, пачками по pk."""
+    last_pk = 0
+    while True:
+        users = list(User.objects
+                     .filter(pk__gt=last_pk, is_active=True)
+                     .exclude(email="")
+                     .order_by("pk")
+                     .values("pk", "username", "email")[:chunk_size])
+        if not users:
+            return
+        yield users
+        last_pk = users[-1]["pk"]
+
+
+def build_digests(users, since, domain):
+    """Письма для пачки пользователей: два запроса на всю пачку
+    (с шардами - по одному за посты на каждый шард их авторов).
+
+    Подписки всей пачки и новые посты всех их авторов берутся разом,
+    а раскладываются по письмам уже в памяти.
+    """
+    authors_of = defaultdict(set)
+    for user_id, author_id in Follow.objects.filter(
+            user_id__in=[user["pk"] for user in users]).values_list(
+            "user_id", "author_id"):
+        authors_of[user_id].add(author_id)
+    all_authors = set().union(*authors_of.values()) if authors_of else set()
+    if not all_authors:
+        return []
+
+    posts_of = defaultdict(list)
+    # по запросу на шард, где лежат посты этих авторов
+    for alias, authors in authors_by_shard(all_authors).items():
+        posts = (Post.objects.using(alias)
+                 .filter(author_id__in=authors, pub_date__gte=since,
+                         author__is_active=True)
+                 .order_by("author_id", "-pub_date")
+                 .values("pk", "text", "pub_date", "author_id",
+                         "author__username"))
+        for post in posts.iterator():
+            author_posts = posts_of[post["author_id"]]
+            if len(author_posts) < settings.DIGEST_POSTS_PER_AUTHOR:
+                post["url"] = "http://{}{}".format(domain, reverse(
+                    "post", args=(post["author__username"], post["pk"])))
+                author_posts.append(post)
+
+    messages = []
+    for user in users:
+        sections = [posts_of[author_id]
+                    for author_id in sorted(authors_of.get(user["pk"], ()))
+                    if posts_of[author_id]]
+        if not sections:
+            continue
+        body = render_to_string("emails/digest.txt", {
+            "user": user, "sections": sections, "since": since,
+            "domain": domain})
+        messages.append(EmailMessage(
+            subject=f"Новые записи ваших авторов на {domain}",
+            body=body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user["email"]]))
+    return messages
+
+
+def send_digests(connection, period="daily", chunk_size=1000, now=None):
+    """Рассылает дайджесты через одно открытое соединение.
+
+    Возвращает (сколько пользователей просмотрено, сколько писем ушло).
+    """
+    since = (now or timezone.now()) - PERIODS[period]
+    domain = Site.objects.get_current().domain
+    seen = sent = 0
+    for users in recipient_chunks(chunk_size):
+        seen += len(users)
+        messages = build_digests(users, since, domain)
+        if messages:
+            sent += connection.send_messages(messages) or 0
+    return seen, sent
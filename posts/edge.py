@@ -0,0 +1,143 @@
+"""Кэширующий прокси перед анонимным трафиком: заголовки и очистка.
+
+Страницы помечаются Surrogate-Key, а сигналы копят ключи изменившихся
+объектов и после коммита ставят их задачей edge_purge: прокси они уходят
+пачками из воркера очереди, а не из запроса пользователя.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .jobs import enqueue, handler
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+def post_keys(posts):
+    return [f"post-{post.pk}" for post in posts]
+
+
+def edge_cache(request, response, keys):
+    """Разрешает прокси кэшировать ответ анониму и помечает его ключами."""
+    response.surrogate_keys = list(dict.fromkeys(keys))
+    patch_vary_headers(response, ("Cookie",))
+    if request.user.is_authenticated or \
+            response.status_code not in (200, 304):
+        patch_cache_control(response, private=True)
+        return response
+    patch_cache_control(response, public=True, max_age=0,
+                        s_maxage=settings.EDGE_CACHE_TTL)
+    response["Surrogate-Key"] = " ".join(response.surrogate_keys)
+    return response
+
+
+class PurgeClient:
+    """Шлёт ключи прокси: запрос EDGE_PURGE_METHOD на EDGE_PURGE_URL
+    с заголовком Surrogate-Key, не больше EDGE_PURGE_BATCH_SIZE ключей
+    в запросе, по одному keep-alive соединению."""
+
+    def __init__(self, url=None, method=None, batch_size=None, timeout=None):
+        self.url = url or settings.EDGE_PURGE_URL
+        self.method = method or settings.EDGE_PURGE_METHOD
+        self.batch_size = batch_size or settings.EDGE_PURGE_BATCH_SIZE
+        self.timeout = timeout or settings.EDGE_PURGE_TIMEOUT
+        self.session = requests.Session()
+
+    def purge(self, keys):
+        """Возвращает число успешных запросов; ошибки только логируются:
+        запись в базу уже прошла, а кэш истечёт сам через EDGE_CACHE_TTL."""
+        keys = sorted(set(keys))
+        sent = 0
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            try:
+                response = self.session.request(
+                    self.method, self.url, timeout=self.timeout,
+                    headers={"Surrogate-Key": " ".join(batch)})
+                response.raise_for_status()
+                sent += 1
+            except requests.RequestException:
+                logger.exception("Не удалось очистить кэш прокси: %s",
+                                 " ".join(batch))
+        return sent
+
+
+def flush():
+    keys = getattr(_pending, "keys", None)
+    _pending.keys = None
+    if keys and settings.EDGE_PURGE_URL:
+        enqueue("edge_purge", total=len(keys), keys=sorted(keys))
+
+
+@handler("edge_purge")
+def purge_keys(job, payload, batch_size):
+    """Отправляет ключи одной транзакции прокси; повтор ничего не шлёт."""
+    if job.cursor:
+        return 0
+    job.cursor = 1
+    PurgeClient().purge(payload["keys"])
+    return len(payload["keys"])
+
+
+def version_key(key):
+    return f"edge:version:{key}"
+
+
+def key_versions(keys):
+    """Текущие версии ключей; недостающие (новые или вытесненные) заводятся.
+
+    Версия - время последнего изменения. Заведённая заново получает
+    то же время со знаком минус: она не совпадёт ни с одной сохранённой
+    версией и не помешает сохранить страницу, начатую раньше. Кэш
+    страниц в процессе (posts/pagecache.py) сверяет с ними сохранённые
+    страницы так же, как прокси - по Surrogate-Key.
+    """
+    versions = cache.get_many([version_key(key) for key in keys])
+    now = -time.time()
+    missing = {version_key(key): now for key in keys
+               if version_key(key) not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[version_key(key)] for key in keys]
+
+
+def invalidate(*keys):
+    """Объекты с этими ключами изменились: сбросить страницы везде.
+
+    Версии меняются после коммита: до него читатель ещё видит старые
+    данные и положил бы старую страницу под новую версию.
+    """
+    transaction.on_commit(lambda: bump_versions(keys))
+    schedule_purge(*keys)
+
+
+def bump_versions(keys):
+    now = time.time()
+    cache.set_many({version_key(key): now for key in keys}, None)
+
+
+def schedule_purge(*keys):
+    """Запоминает ключи до коммита текущей транзакции.
+
+    Все изменения одной транзакции уходят к прокси одной задачей.
+    """
+    if not settings.EDGE_PURGE_URL:
+        return
+    connection = transaction.get_connection()
+    queued = connection.in_atomic_block and any(
+        func is flush for _, func in connection.run_on_commit)
+    if queued:
+        _pending.keys.update(keys)
+    else:
+        # ключи откатившейся транзакции чистить не нужно
+        _pending.keys = set(keys)
+        transaction.on_commit(flush)
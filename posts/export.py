@@ -0,0 +1,134 @@
+import json
+import time
+import zipfile
+
+from django.core.files.storage import default_storage
+
+from .models import ArchivedComment, ArchivedPost, Comment, Follow, Post
+from .shards import each_shard, on_author_shard
+
+EXPORT_CHUNK_SIZE = 500
+
+
+class ZipStream:
+    """Файлоподобный буфер без seek: zipfile пишет в него, мы забираем."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def keyset_batches(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Отдаёт строки пачками по pk.
+
+    Каждая пачка вычитывается целиком отдельным коротким запросом, так что
+    между пачками курсор и транзакция не держатся, как бы медленно ни
+    читал клиент.
+    """
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)
+                    .order_by("pk")[:chunk_size].iterator())
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]["pk"]
+
+
+def post_rows(user):
+    queryset = on_author_shard(Post.objects.all(), user.pk).filter(
+        author=user).values(
+        "pk", "text", "pub_date", "group__slug", "image")
+    for rows in keyset_batches(queryset):
+        yield [{"id": row["pk"],
+                "text": row["text"],
+                "pub_date": row["pub_date"].isoformat(),
+                "group": row["group__slug"],
+                "image": row["image"] or None} for row in rows]
+    # архивные посты отдаём моделями: текст может быть сжат
+    queryset = ArchivedPost.objects.filter(author=user).select_related(
+        "group")
+    last_pk = 0
+    while True:
+        posts = list(queryset.filter(pk__gt=last_pk).order_by("pk")
+                     [:EXPORT_CHUNK_SIZE].iterator())
+        if not posts:
+            return
+        yield [{"id": post.pk,
+                "text": post.text,
+                "pub_date": post.pub_date.isoformat(),
+                "group": post.group.slug if post.group else None,
+                "image": post.image.name or None} for post in posts]
+        last_pk = posts[-1].pk
+
+
+def comment_rows(user):
+    # комментарий лежит на шарде поста, а не своего автора
+    for queryset in [*each_shard(Comment.objects.all()),
+                     ArchivedComment.objects.all()]:
+        queryset = queryset.filter(author=user).values(
+            "pk", "post_id", "text", "created")
+        for rows in keyset_batches(queryset):
+            yield [{"id": row["pk"],
+                    "post": row["post_id"],
+                    "text": row["text"],
+                    "created": row["created"].isoformat()} for row in rows]
+
+
+def follow_rows(user):
+    queryset = Follow.objects.filter(user=user).values(
+        "pk", "author__username")
+    for rows in keyset_batches(queryset):
+        yield [{"author": row["author__username"]} for row in rows]
+
+
+def image_names(user):
+    for queryset in (on_author_shard(Post.objects.all(), user.pk),
+                     ArchivedPost.objects.all()):
+        queryset = queryset.filter(author=user).exclude(
+            image__isnull=True).exclude(image="").values("pk", "image")
+        for rows in keyset_batches(queryset):
+            for row in rows:
+                yield row["image"]
+
+
+def archive_chunks(user):
+    """Собирает zip с данными пользователя, отдавая его по кускам.
+
+    В памяти держится только текущая пачка строк или кусок картинки.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, batches in (("posts.jsonl", post_rows(user)),
+                              ("comments.jsonl", comment_rows(user)),
+                              ("follows.jsonl", follow_rows(user))):
+            with archive.open(name, "w", force_zip64=True) as entry:
+                for batch in batches:
+                    for row in batch:
+                        line = json.dumps(row, ensure_ascii=False) + "\n"
+                        entry.write(line.encode())
+                    yield stream.drain()
+
+        for image in image_names(user):
+            if not default_storage.exists(image):
+                continue
+            info = zipfile.ZipInfo(image, time.localtime()[:6])
+            # картинки уже сжаты, deflate только потратит CPU
+            info.compress_type = zipfile.ZIP_STORED
+            with default_storage.open(image) as src, \
+                    archive.open(info, "w", force_zip64=True) as dst:
+                for chunk in src.chunks():
+                    dst.write(chunk)
+                    yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from .edge import edge_cache
+from .models import Group, Post
+from .pagecache import shared_page_cache
+from .shards import fan_in
+from .views import group_identity
+
+User = get_user_model()
+
+
+class PostFeed(Feed):
+    """Последние посты. Ответ кэшируется целиком (shared_page_cache) и
+    пересобирается, только когда меняется версия ключей из surrogate_keys:
+    их сбрасывают те же сигналы, что чистят страницы."""
+
+    def __call__(self, request, *args, **kwargs):
+        response = super().__call__(request, *args, **kwargs)
+        return edge_cache(request, response, request.feed_keys)
+
+    def get_feed(self, obj, request):
+        # экземпляр ленты общий для всех потоков, поэтому ключи - в request
+        request.feed_keys = self.surrogate_keys(obj)
+        return super().get_feed(obj, request)
+
+    def surrogate_keys(self, obj):
+        return ["index"]
+
+    def posts(self, obj):
+        return Post.objects.filter(author__is_active=True)
+
+    def items(self, obj):
+        # с шардами - слияние последних постов всех шардов
+        return fan_in(self.posts(obj).select_related("author")
+                      .order_by("-pub_date"))[:settings.FEED_SIZE]
+
+    def item_title(self, post):
+        return Truncator(post.text).chars(60)
+
+    def item_description(self, post):
+        return post.text_html or post.text
+
+    def item_link(self, post):
+        return reverse("post", args=(post.author.username, post.pk))
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.username
+
+
+class SiteFeed(PostFeed):
+    title = "Yatube: последние записи"
+    description = "Новые записи всех авторов"
+
+    def link(self):
+        return reverse("index")
+
+
+class AuthorFeed(PostFeed):
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username, is_active=True)
+
+    def surrogate_keys(self, author):
+        return [f"author-{author.pk}"]
+
+    def posts(self, author):
+        return author.posts.all()
+
+    def items(self, author):
+        # author.posts уже ведёт на шард автора
+        return (self.posts(author).select_related("author")
+                .order_by("-pub_date")[:settings.FEED_SIZE])
+
+    def title(self, author):
+        return f"Yatube: записи @{author.username}"
+
+    def description(self, author):
+        return f"Новые записи автора @{author.username}"
+
+    def link(self, author):
+        return reverse("profile", args=(author.username,))
+
+
+class GroupFeed(PostFeed):
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def surrogate_keys(self, group):
+        return [f"group-{group.pk}"]
+
+    def posts(self, group):
+        return group.group.filter(author__is_active=True)
+
+    def title(self, group):
+        return f"Yatube: #{group.title}"
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse("group", args=(group.slug,))
+
+
+def atom(feed_class):
+    return type(f"Atom{feed_class.__name__}", (feed_class,), {
+        "feed_type": Atom1Feed,
+        "subtitle": feed_class.description,
+    })
+
+
+def author_identity(request, username):
+    return User.objects.filter(username=username, is_active=True).values_list(
+        "pk", flat=True).first()
+
+
+site_rss = shared_page_cache(SiteFeed())
+site_atom = shared_page_cache(atom(SiteFeed)())
+author_rss = shared_page_cache(AuthorFeed(), identity=author_identity)
+author_atom = shared_page_cache(atom(AuthorFeed)(), identity=author_identity)
+group_rss = shared_page_cache(GroupFeed(), identity=group_identity)
+group_atom = shared_page_cache(atom(GroupFeed)(), identity=group_identity)
@@ -0,0 +1,63 @@
+from django.db import connections, router
+from django.dispatch import Signal
+
+from .models import Follow
+
+# подписка или отписка через follow()/unfollow(): instance - несохранённый
+# Follow с user_id и author_id, created - True для подписки
+follow_changed = Signal(providing_args=["instance", "created"])
+
+
+def follow(user, author):
+    """Подписывает одним INSERT, дубль молча отбрасывает уникальный индекс.
+
+    Возвращает True, если подписка новая. Параллельные клики не создают
+    вторую строку и не падают на IntegrityError.
+    """
+    connection = connections[router.db_for_write(Follow)]
+    ops = connection.ops
+    fields = [Follow._meta.get_field(name).column
+              for name in ("user", "author")]
+    sql = "%s %s (%s) VALUES (%%s, %%s)%s" % (
+        ops.insert_statement(ignore_conflicts=True),
+        ops.quote_name(Follow._meta.db_table),
+        ", ".join(ops.quote_name(field) for field in fields),
+        (" " + ops.ignore_conflicts_suffix_sql(ignore_conflicts=True))
+        .rstrip())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, author.pk])
+        created = cursor.rowcount == 1
+    if created:
+        follow_changed.send(sender=Follow, created=True,
+                            instance=Follow(user=user, author=author))
+    return created
+
+
+def unfollow(user, author):
+    """Отписывает одним DELETE; True, если подписка была.
+
+    У Follow нет receiver'ов pre/post_delete, поэтому Django удаляет
+    без предварительного SELECT.
+    """
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    if deleted:
+        follow_changed.send(sender=Follow, created=False,
+                            instance=Follow(user=user, author=author))
+    return bool(deleted)
+
+
+def delete_follows(queryset):
+    """Удаляет подписки мимо unfollow() и сообщает о каждой follow_changed.
+
+    Для админки, удаления аккаунта и каскада от пользователя: post_delete
+    у Follow не слушается. Возвращает число удалённых.
+    """
+    rows = list(queryset.values_list("pk", "user_id", "author_id"))
+    if not rows:
+        return 0
+    Follow.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    for _, user_id, author_id in rows:
+        follow_changed.send(sender=Follow, created=False,
+                            instance=Follow(user_id=user_id,
+                                            author_id=author_id))
+    return len(rows)
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth import get_user_model
 
 from .models import Comment, Post
+from .uploads import rejection_message
 
 User = get_user_model()
 
@@ -13,7 +14,7 @@ class PostForm(forms.ModelForm):
         group = forms.ModelChoiceField(queryset=Post.objects.all(),
                                        required=False, to_field_name="group")
         widgets = {
-            'text': forms.Textarea(),
+            'text': forms.Textarea(attrs={'data-mentions': 'on'}),
         }
 
         labels = {
@@ -21,6 +22,24 @@ class PostForm(forms.ModelForm):
             "text": "Текст"
         }
 
+    def clean(self):
+        # LimitedUploadHandler уже обнулил файл, ImageField его отверг;
+        # здесь только объясняем почему
+        image = self.files.get(self.add_prefix("image"))
+        reason = getattr(image, "rejected", None)
+        if reason:
+            self.add_error("image", rejection_message(reason))
+        return super().clean()
+
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        if "image" in self.changed_data:
+            post.image_checked = False
+        if commit:
+            post.save_edits()
+            self._save_m2m()
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -28,7 +47,7 @@ class CommentForm(forms.ModelForm):
         fields = ("text",)
 
         widgets = {
-            'text': forms.Textarea(),
+            'text': forms.Textarea(attrs={'data-mentions': 'on'}),
         }
 
         labels = {
@@ -0,0 +1,71 @@
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Регистрирует обработчик задач вида kind.
+
+    Обработчик получает (job, payload, batch_size), делает одну пачку
+    работы начиная с job.cursor, сдвигает курсор и возвращает, сколько
+    обработал; 0 означает, что задача выполнена.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, total=None, **payload):
+    job = Job.objects.create(kind=kind, total=total,
+                             payload=json.dumps(payload))
+    if settings.JOBS_RUN_EAGERLY:
+        transaction.on_commit(lambda: run_job(job))
+    return job
+
+
+def run_batch(job, batch_size=None):
+    """Одна пачка работы; курсор сохраняется в той же транзакции."""
+    batch_size = batch_size or settings.JOBS_BATCH_SIZE
+    with transaction.atomic():
+        done = HANDLERS[job.kind](job, job.get_payload(), batch_size)
+        job.processed += done
+        job.status = Job.RUNNING if done else Job.DONE
+        job.save()
+    return done
+
+
+def run_job(job, batch_size=None):
+    try:
+        while run_batch(job, batch_size):
+            pass
+    except Exception as error:
+        logger.exception("Задача %s упала", job)
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED,
+                                             error=repr(error))
+        job.status = Job.FAILED
+    return job
+
+
+def run_pending(batch_size=None):
+    """Выполняет всё, что ждёт в очереди, включая прерванные задачи.
+
+    Рассчитано на один воркер: задачи в статусе running считаются
+    брошенными упавшим воркером и продолжаются с сохранённого курсора.
+    """
+    count = 0
+    while True:
+        job = (Job.objects.filter(status__in=(Job.PENDING, Job.RUNNING))
+               .order_by("pk").first())
+        if job is None:
+            return count
+        run_job(job, batch_size)
+        count += 1
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.archive import ARCHIVE_BATCH_SIZE, archive_batch
+
+
+class Command(BaseCommand):
+    help = "Переносит посты старше --days дней с комментариями в архив"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--batch-size", type=int,
+                            default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--compress", action="store_true",
+                            help="хранить текст в архиве сжатым zlib")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        total = 0
+        while True:
+            moved = archive_batch(cutoff, compress=options["compress"],
+                                  batch_size=options["batch_size"])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f"перенесено {total}")
+        self.stdout.write(self.style.SUCCESS(
+            f"В архиве {total} новых постов старше {cutoff:%Y-%m-%d}"))
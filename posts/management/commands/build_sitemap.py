@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.sitemap import build_sitemap
+
+
+class Command(BaseCommand):
+    help = ("Пересобирает изменившиеся куски sitemap и индекс "
+            "sitemap.xml в SITEMAP_ROOT")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="пересобрать все куски")
+
+    def handle(self, *args, **options):
+        built = build_sitemap(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Собрано кусков: {built}"))
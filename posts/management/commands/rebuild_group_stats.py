@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import rebuild_group_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики сообществ с нуля"
+
+    def handle(self, *args, **options):
+        rebuild_group_stats()
+        self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны"))
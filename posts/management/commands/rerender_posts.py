@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post
+from posts.rendering import RENDERER_VERSION, rerender_batch
+from posts.shards import all_aliases, is_sharded
+
+
+class Command(BaseCommand):
+    help = ("Перерисовывает HTML постов и комментариев, "
+            "отрисованных старой версией рендерера")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        aliases = all_aliases() if is_sharded() else [None]
+        for model in (Post, Comment):
+            batches = 0
+            for alias in aliases:
+                last_pk = 0
+                while True:
+                    last_pk = rerender_batch(model, last_pk,
+                                             options["batch_size"], alias)
+                    if last_pk is None:
+                        break
+                    batches += 1
+                    self.stdout.write(f"{model.__name__}: до id {last_pk}")
+            self.stdout.write(self.style.SUCCESS(
+                f"{model.__name__}: пачек {batches}, "
+                f"версия рендерера {RENDERER_VERSION}"))
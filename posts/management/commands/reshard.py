@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.shards import (all_aliases, finish_move, home_shard, move_author,
+                          placement, sync_replicas)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Переносит посты авторов на шарды по текущему POST_SHARDS; "
+            "запускать после добавления или удаления шарда")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="только показать, кто куда переедет")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options["dry_run"]:
+            for alias in settings.POST_SHARDS:
+                sync_replicas(alias)
+        moved_authors = 0
+        sources = set(all_aliases())
+        last_pk = 0
+        while True:
+            ids = list(User.objects.filter(pk__gt=last_pk).order_by("pk")
+                       .values_list("pk", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            for author_id in ids:
+                source, target = placement(author_id), home_shard(author_id)
+                if source == target:
+                    continue
+                moved_authors += 1
+                if options["dry_run"]:
+                    self.stdout.write(f"{author_id}: {source} -> {target}")
+                else:
+                    move_author(author_id, target)
+                    sources.add(source)
+        moved_posts = 0
+        if not options["dry_run"]:
+            if moved_authors:
+                # воркеры ещё пишут по старой карте, пока она не истекла
+                time.sleep(settings.SHARD_CACHE_TIMEOUT)
+            moved_posts = self.finish_moves(sorted(sources))
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено авторов: {moved_authors}, постов: {moved_posts}"))
+
+    def finish_moves(self, aliases):
+        """Чистит базы от авторов, чей шард теперь другой.
+
+        Так доделываются и переносы, прерванные прошлым запуском.
+        """
+        moved_posts = 0
+        for alias in aliases:
+            authors = (Post.objects.using(alias).order_by()
+                       .values_list("author_id", flat=True).distinct())
+            for author_id in list(authors):
+                if placement(author_id) != alias:
+                    moved_posts += finish_move(author_id, alias)
+        return moved_posts
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди (один воркер)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="разобрать очередь и выйти")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--sleep", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending(options["batch_size"])
+            if count:
+                self.stdout.write(f"выполнено задач: {count}")
+            if options["once"]:
+                return
+            time.sleep(options["sleep"])
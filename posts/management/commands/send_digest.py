@@ -0,0 +1,24 @@
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from posts.digest import PERIODS, send_digests
+
+
+class Command(BaseCommand):
+    help = "Рассылает дайджест новых записей авторов из подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", choices=sorted(PERIODS),
+                            default="daily")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        connection.open()
+        try:
+            seen, sent = send_digests(connection, options["period"],
+                                      options["chunk_size"])
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Пользователей: {seen}, писем отправлено: {sent}"))
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupAuthorStats = apps.get_model('posts', 'GroupAuthorStats')
+    GroupAuthorStats.objects.all().delete()
+    GroupStats.objects.all().delete()
+    counts = {}
+    for name in ('Post', 'ArchivedPost'):
+        rows = (apps.get_model('posts', name).objects
+                .filter(group__isnull=False)
+                .values('group_id', 'author_id')
+                .annotate(posts=Count('pk'), latest=Max('pub_date')))
+        for row in rows:
+            key = (row['group_id'], row['author_id'])
+            posts, latest = counts.get(key, (0, None))
+            counts[key] = (posts + row['posts'],
+                           max(filter(None, (latest, row['latest']))))
+
+    GroupAuthorStats.objects.bulk_create(
+        GroupAuthorStats(group_id=group_id, author_id=author_id,
+                         post_count=posts)
+        for (group_id, author_id), (posts, _) in counts.items())
+    for group in Group.objects.all():
+        rows = [(posts, latest) for (group_id, _), (posts, latest)
+                in counts.items() if group_id == group.pk]
+        top = (GroupAuthorStats.objects.filter(group_id=group.pk)
+               .order_by('-post_count', 'author_id')
+               .values_list('author__username', flat=True)[:3])
+        GroupStats.objects.create(
+            group_id=group.pk,
+            post_count=sum(posts for posts, _ in rows),
+            last_post_date=max((latest for _, latest in rows), default=None),
+            top_authors=','.join(top))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_auto_20261019_0112'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
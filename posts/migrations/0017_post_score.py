@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_auto_20261019_0118'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,53 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def event_score(kind, when):
+    age = (when - EPOCH).total_seconds()
+    return (math.log(settings.POPULAR_WEIGHTS[kind])
+            + age * math.log(2) / settings.POPULAR_HALF_LIFE)
+
+
+def log_sum_exp(values):
+    top = max(values)
+    return top + math.log(sum(math.exp(value - top) for value in values))
+
+
+def fill_post_score(apps, schema_editor):
+    """Счёт уже опубликованных постов: сама публикация и комментарии."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk', 'pub_date')[:1000])
+        if not posts:
+            return
+        events = defaultdict(list)
+        for post_id, created in Comment.objects.filter(
+                post_id__in=[post.pk for post in posts]).values_list(
+                'post_id', 'created'):
+            events[post_id].append(event_score('comment', created))
+        for post in posts:
+            post.score = log_sum_exp([event_score('post', post.pub_date)]
+                                     + events[post.pk])
+        Post.objects.bulk_update(posts, ['score'])
+        last_pk = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_post_score, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+
+
+def dedupe_follows(apps, schema_editor):
+    """Оставляет по одной, самой ранней, подписке на пару (user, author).
+
+    Пары берутся пачками, каждая пачка - своя транзакция, чтобы на
+    большой таблице не держать блокировку всю миграцию.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    duplicates = (Follow.objects.values('user_id', 'author_id')
+                  .annotate(keep=Min('pk'), rows=Count('pk'))
+                  .filter(rows__gt=1).order_by('user_id', 'author_id'))
+    while True:
+        with transaction.atomic():
+            batch = list(duplicates[:BATCH_SIZE])
+            for row in batch:
+                Follow.objects.filter(
+                    user_id=row['user_id'], author_id=row['author_id'],
+                ).exclude(pk=row['keep']).delete()
+        if len(batch) < BATCH_SIZE:
+            return
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0020_auto_20261019_0134'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+    ]
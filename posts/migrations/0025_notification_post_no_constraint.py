@@ -0,0 +1,19 @@
+# Generated by Django 2.2.6 on 2026-10-19 02:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_auto_20261019_0146'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='posts.Post'),
+        ),
+    ]
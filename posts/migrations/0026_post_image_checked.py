@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_notification_post_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_checked',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import json
+import zlib
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -12,22 +15,69 @@ class Group(models.Model):
     def __str__(self):
         return self.title
 
+
+class ShardedManager(models.Manager):
+    """create() без using() отдаёт выбор базы роутеру по самому объекту.
+
+    Обычный create() сохраняет в self.db, а роутер без объекта не знает
+    автора, см. posts/shards.py.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
 class Post(models.Model):
     text = models.TextField()
-    pub_date = models.DateTimeField("date published", auto_now_add=True)
+    pub_date = models.DateTimeField("date published", auto_now_add=True,
+                                    db_index=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="posts")
     group = models.ForeignKey(Group, related_name="group",
                               on_delete=models.SET_NULL, max_length=100,
                               blank=True, null=True)
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', blank=True, null=True,
+                              db_index=True)
+    # False, пока загрузку из формы не проверила задача verify_image;
+    # до этого в ленте заглушка, см. posts/uploads.py
+    image_checked = models.BooleanField(default=True, editable=False)
+    # рейтинг для ленты «Популярное», см. posts/ranking.py
+    score = models.FloatField(default=0, db_index=True, editable=False)
+    # text, отрисованный при сохранении, см. posts/rendering.py
+    text_html = models.TextField(blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0,
+                                                      editable=False)
+    # просмотры пишутся пачками, см. posts/counters.py
+    views = models.PositiveIntegerField(default=0, editable=False)
+
+    is_archived = False
+
+    objects = ShardedManager()
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [models.Index(fields=["group", "-pub_date"]),
+                   models.Index(fields=["author", "-pub_date"])]
 
     def __str__(self):
         return self.text
 
+    def save_edits(self):
+        """Сохраняет правку всех полей, кроме views.
+
+        Просмотры копятся в памяти и пишутся своим UPDATE (counters.py);
+        полный save записал бы устаревшее число, загруженное с постом.
+        """
+        if self.pk is None:
+            return self.save()
+        self.save(update_fields=[
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != "views"])
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
@@ -35,12 +85,180 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="comments", null=True)
     text = models.TextField()
-    created = models.DateTimeField(auto_now_add=True)
+    text_html = models.TextField(blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0,
+                                                      editable=False)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
     unique_together = ["post", "author"]
 
+    objects = ShardedManager()
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "author"],
+                                    name="unique_follow"),
+        ]
+
+
+class GroupStats(models.Model):
+    """Счётчики сообщества, обновляются сигналами при правке постов."""
+    group = models.OneToOneField(Group, on_delete=models.CASCADE,
+                                 primary_key=True, related_name="stats")
+    post_count = models.PositiveIntegerField(default=0)
+    last_post_date = models.DateTimeField(null=True, db_index=True)
+    top_authors = models.CharField(max_length=255, blank=True)
+
+    @property
+    def top_author_names(self):
+        return [name for name in self.top_authors.split(",") if name]
+
+
+class GroupAuthorStats(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE,
+                              related_name="author_stats")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="group_stats")
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["group", "author"]
+        indexes = [models.Index(fields=["group", "-post_count"])]
+
+
+class ArchivedPost(models.Model):
+    """Холодная копия старого поста, id совпадает с исходным Post."""
+    id = models.IntegerField(primary_key=True)
+    raw_text = models.TextField(blank=True)
+    compressed_text = models.BinaryField(null=True)
+    pub_date = models.DateTimeField("date published")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="archived_posts")
+    group = models.ForeignKey(Group, related_name="archived_posts",
+                              on_delete=models.SET_NULL,
+                              blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', blank=True, null=True,
+                              db_index=True)
+    archived = models.DateTimeField(auto_now_add=True)
+    views = models.PositiveIntegerField(default=0, editable=False)
+
+    is_archived = True
+    image_checked = True
+
+    class Meta:
+        ordering = ["-pub_date"]
+        indexes = [models.Index(fields=["author", "-pub_date"])]
+
+    @property
+    def text(self):
+        if self.compressed_text is not None:
+            return zlib.decompress(self.compressed_text).decode()
+        return self.raw_text
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE,
+                             related_name='comments')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="archived_comments", null=True)
+    text = models.TextField()
+    created = models.DateTimeField()
+
+    class Meta:
+        ordering = ["created"]
+
+
+class Job(models.Model):
+    """Фоновая задача, которую по пачкам выполняет manage.py run_jobs."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "в очереди"),
+        (RUNNING, "выполняется"),
+        (DONE, "готово"),
+        (FAILED, "ошибка"),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=PENDING)
+    cursor = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["pk"]
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+    @property
+    def progress(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.total:
+            return None
+        return min(100, self.processed * 100 // self.total)
+
+
+class Notification(models.Model):
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE,
+                                  related_name="notifications")
+    # с шардами пост лежит не в default, где уведомление: ключ без
+    # ограничения в базе, посты подбирает notifications.attach_posts
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="notifications",
+                             db_constraint=False)
+    created = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [models.Index(fields=["recipient", "is_read"])]
+
+
+class SitemapShard(models.Model):
+    """Кусок sitemap: посты с id от number * SITEMAP_SHARD_SIZE.
+
+    dirty - в куске менялись посты, файл надо пересобрать.
+    """
+    number = models.PositiveIntegerField(primary_key=True)
+    dirty = models.BooleanField(default=True, db_index=True)
+    urls = models.PositiveIntegerField(default=0)
+    lastmod = models.DateTimeField(null=True)
+
+
+class AuthorShard(models.Model):
+    """Карта шардов: в какой базе лежат посты автора, см. posts/shards.py.
+
+    Нет строки - посты автора в default (записаны до включения шардов).
+    """
+    author = models.OneToOneField(User, on_delete=models.CASCADE,
+                                  primary_key=True, related_name="shard")
+    alias = models.CharField(max_length=50)
+
+
+class IdSequence(models.Model):
+    """Общий на все шарды счётчик id: автоинкремент каждой базы свой."""
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
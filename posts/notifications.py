@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .jobs import handler
+from .models import Follow, Notification, Post
+from .shards import all_aliases
+
+
+def unread_cache_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def unread_count(user):
+    return cache.get_or_set(
+        unread_cache_key(user.pk),
+        lambda: Notification.objects.filter(recipient=user,
+                                            is_read=False).count(),
+        settings.NOTIFICATIONS_CACHE_TIMEOUT)
+
+
+def mark_read(user, ids):
+    """Отмечает прочитанными показанные уведомления, и только их."""
+    Notification.objects.filter(recipient=user, is_read=False,
+                                pk__in=ids).update(is_read=True)
+    cache.delete(unread_cache_key(user.pk))
+
+
+def attach_posts(notifications):
+    """Уведомления с постами, собранными по id со всех шардов.
+
+    Посты удалённых и отключённых авторов отбрасываются, как и в
+    запросе без шардов.
+    """
+    notifications = list(notifications)
+    ids = {notification.post_id for notification in notifications}
+    posts = {}
+    for alias in all_aliases():
+        posts.update((post.pk, post) for post in
+                     Post.objects.using(alias)
+                     .filter(pk__in=ids, author__is_active=True)
+                     .select_related("author", "group"))
+    attached = []
+    for notification in notifications:
+        if notification.post_id in posts:
+            notification.post = posts[notification.post_id]
+            attached.append(notification)
+    return attached
+
+
+@handler("notify_followers")
+def notify_followers(job, payload, batch_size):
+    """Раздаёт уведомление о посте подписчикам автора пачками по pk."""
+    if job.total is None:
+        job.total = Follow.objects.filter(
+            author_id=payload["author_id"]).count()
+    follows = list(Follow.objects
+                   .filter(author_id=payload["author_id"], pk__gt=job.cursor)
+                   .order_by("pk").values_list("pk", "user_id")[:batch_size])
+    if not follows:
+        return 0
+    Notification.objects.bulk_create(
+        Notification(recipient_id=user_id, post_id=payload["post_id"])
+        for _, user_id in follows)
+    cache.delete_many([unread_cache_key(user_id) for _, user_id in follows])
+    job.cursor = follows[-1][0]
+    return len(follows)
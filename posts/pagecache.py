@@ -0,0 +1,90 @@
+import hashlib
+import html
+import json
+import re
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import RequestContext
+from django.template.loader import get_template
+
+from .edge import edge_cache, key_versions
+
+HOLE_RE = re.compile(r"<!--hole (.*?)-->")
+
+
+def page_cache_key(request, identity=""):
+    # вьюхи смотрят только на номер страницы; путь и номер пишет клиент,
+    # а memcached не примет в ключе пробелы и длиннее 250 байт
+    raw = f"{request.path}:{identity}:{request.GET.get('page', '')}"
+    return "pagecache:" + hashlib.md5(raw.encode()).hexdigest()
+
+
+def fill_holes(request, content):
+    """Дорисовывает в общей странице фрагменты текущего пользователя."""
+    if b"<!--hole " not in content:
+        return content
+    context = RequestContext(request)
+
+    def render(match):
+        template_name, kwargs = json.loads(html.unescape(match.group(1)))
+        with context.push(**kwargs):
+            return get_template(template_name).template.render(context)
+
+    return HOLE_RE.sub(render, content.decode()).encode()
+
+
+def shared_page_cache(view=None, identity=None):
+    """Кэш целой страницы, общий для анонимов и вошедших пользователей.
+
+    Страница рисуется один раз с метками вместо личных фрагментов
+    ({% hole %}) и хранится вместе с версиями своих Surrogate-Key.
+    Сигналы меняют версии (edge.invalidate), и устаревшая страница
+    рисуется заново. Страница не сохраняется, если хоть один её ключ
+    изменился после начала рисования: она могла собраться из старых
+    данных. На каждый запрос дорисовываются только метки.
+
+    identity(request, *args, **kwargs) - id объекта страницы, если адрес
+    может перейти к другому объекту (группу со слагом удалили и создали
+    заново); None - кэш не нужен, пусть вьюха сама ответит 404.
+    """
+    if view is None:
+        return partial(shared_page_cache, identity=identity)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+        ident = identity(request, *args, **kwargs) if identity else ""
+        if ident is None:
+            return view(request, *args, **kwargs)
+        key = page_cache_key(request, ident)
+        entry = cache.get(key)
+        if entry is not None and key_versions(entry["keys"]) == \
+                entry["versions"]:
+            response = HttpResponse(entry["content"],
+                                    content_type=entry["content_type"])
+            response = edge_cache(request, response, entry["keys"])
+        else:
+            started = time.time()
+            request.punch_holes = True
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request.punch_holes = False
+            keys = getattr(response, "surrogate_keys", None)
+            if response.status_code == 200 and keys is not None:
+                versions = key_versions(keys)
+                if all(version < started for version in versions):
+                    cache.set(key, {
+                        "content": response.content,
+                        "content_type": response["Content-Type"],
+                        "keys": keys,
+                        "versions": versions,
+                    }, settings.PAGE_CACHE_TIMEOUT)
+        response.content = fill_holes(request, response.content)
+        return response
+    return wrapper
@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import edge
+from .follows import delete_follows
+from .jobs import enqueue, handler
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                     GroupAuthorStats, Notification, Post)
+from .shards import each_shard, on_author_shard
+from .stats import (apply_deltas, post_deltas, refresh_top_authors,
+                    stats_frozen)
+
+User = get_user_model()
+
+
+def purge_stages(user_id):
+    """Что удалять и в каком порядке: сначала то, что ссылается на посты.
+
+    Тогда каскад при удалении поста (и в конце самого пользователя)
+    ничего не находит и не грузит в память.
+
+    Посты и комментарии ищутся на каждом шарде; уведомления к постам
+    (они в default) удаляются вместе с пачкой постов.
+    """
+    return (
+        Notification.objects.filter(recipient_id=user_id),
+        *each_shard(Comment.objects.filter(author_id=user_id)),
+        *each_shard(Comment.objects.filter(post__author_id=user_id)),
+        ArchivedComment.objects.filter(author_id=user_id),
+        ArchivedComment.objects.filter(post__author_id=user_id),
+        Follow.objects.filter(user_id=user_id),
+        Follow.objects.filter(author_id=user_id),
+        *each_shard(Post.objects.filter(author_id=user_id)),
+        ArchivedPost.objects.filter(author_id=user_id),
+        GroupAuthorStats.objects.filter(author_id=user_id),
+    )
+
+
+def delete_account(user):
+    """Мягкое удаление: пользователь и его записи пропадают сразу,
+    а строки и картинки удаляет фоновая задача purge_user."""
+    user.is_active = False
+    user.save(update_fields=["is_active"])
+    groups = (on_author_shard(Post.objects.all(), user.pk)
+              .filter(author=user, group__isnull=False)
+              .values_list("group_id", flat=True).distinct())
+    edge.invalidate("index", f"author-{user.pk}",
+                    *(f"group-{group_id}" for group_id in groups))
+    # сколько строк удалять, задача посчитает сама
+    return enqueue("purge_user", user_id=user.pk)
+
+
+def delete_images(names):
+    """Удаляет файлы картинок, на которые больше никто не ссылается."""
+    names = set(filter(None, names))
+    for queryset in [*each_shard(Post.objects.all()),
+                     ArchivedPost.objects.all()]:
+        names -= set(queryset.filter(image__in=names)
+                     .values_list("image", flat=True))
+    for name in names:
+        default_storage.delete(name)
+
+
+@handler("purge_user")
+def purge_user(job, payload, batch_size):
+    """Удаляет пачку строк первого непустого этапа, а в конце - пользователя.
+
+    Курсор только отмечает первый запуск, когда считается объём работы
+    и пользователь убирается из «топа авторов»; удалённые строки и так
+    не попадают в выборку.
+    """
+    user_id = payload["user_id"]
+    if User.objects.filter(pk=user_id, is_active=True).exists():
+        # пока задача ждала, учётную запись восстановили
+        return 0
+    if not job.cursor:
+        job.cursor = 1
+        job.total = sum(queryset.count()
+                        for queryset in purge_stages(user_id)) + 1
+        for group_id in (GroupAuthorStats.objects.filter(author_id=user_id)
+                         .values_list("group_id", flat=True)):
+            refresh_top_authors(group_id)
+    for queryset in purge_stages(user_id):
+        ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            continue
+        batch = queryset.model.objects.using(queryset.db).filter(pk__in=ids)
+        if queryset.model is Post:
+            Notification.objects.filter(post_id__in=ids).delete()
+        if queryset.model in (Post, ArchivedPost):
+            deltas = post_deltas(batch.values_list("group_id", "author_id"),
+                                 -1)
+            images = list(batch.values_list("image", flat=True))
+            with stats_frozen():
+                batch.delete()
+            apply_deltas(deltas)
+            transaction.on_commit(lambda: delete_images(images))
+        elif queryset.model is Follow:
+            delete_follows(batch)
+        else:
+            batch.delete()
+        return len(ids)
+    deleted, _ = User.objects.filter(pk=user_id).delete()
+    return 1 if deleted else 0
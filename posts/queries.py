@@ -0,0 +1,23 @@
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def with_comment_count(queryset):
+    """Добавляет постам comment_count коррелированным подзапросом.
+
+    В отличие от annotate(Count(...)) с JOIN и GROUP BY по всей таблице,
+    подзапрос считается только для строк, попавших на страницу.
+    """
+    comments = queryset.model._meta.get_field("comments").related_model
+    count = (comments.objects
+             .filter(post=OuterRef("pk"), author__is_active=True)
+             .order_by().values("post")
+             .annotate(total=Count("pk")).values("total"))
+    return queryset.annotate(comment_count=Coalesce(
+        Subquery(count, output_field=IntegerField()), 0))
+
+
+def author_sidebar_key(author_id):
+    """Ключ фрагмента {% cache ... author_sidebar author.pk %}."""
+    return make_template_fragment_key("author_sidebar", [author_id])
@@ -0,0 +1,65 @@
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import Post
+from .queries import with_comment_count
+from .shards import fan_in, is_sharded, on_author_shard
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def event_score(kind, when=None):
+    """Вклад события в счёт поста, в логарифмической шкале.
+
+    Вес события удваивается каждые POPULAR_HALF_LIFE секунд от EPOCH:
+    так свежие события весят больше, а уже накопленные счета не надо
+    пересчитывать - все они «стареют» одинаково.
+    """
+    when = when or timezone.now()
+    age = (when - EPOCH).total_seconds()
+    return (math.log(settings.POPULAR_WEIGHTS[kind])
+            + age * math.log(2) / settings.POPULAR_HALF_LIFE)
+
+
+def add_score(queryset, kind, when=None):
+    """score = ln(exp(score) + exp(event)) одним UPDATE, без чтения строк.
+
+    Форма max(a, b) + ln(1 + exp(-|a - b|)) не переполняется.
+    """
+    event = event_score(kind, when)
+    return queryset.update(score=Greatest(F("score"), event) + Ln(
+        1 + Exp(-Abs(F("score") - event))))
+
+
+def bump_post(post_id, kind, when=None, using=None):
+    """Событие поста; using - база поста (комментарий лежит рядом с ним)."""
+    return add_score(Post.objects.db_manager(using).filter(pk=post_id),
+                     kind, when)
+
+
+def bump_latest_post(author_id, kind, when=None):
+    """Событие автора (новый подписчик) поднимает его последний пост."""
+    posts = on_author_shard(Post.objects.all(), author_id)
+    latest = (posts.filter(author_id=author_id)
+              .values_list("pk", flat=True).first())
+    if latest is None:
+        return 0
+    return bump_post(latest, kind, when, using=posts.db)
+
+
+def popular_posts():
+    """Верх рейтинга: не больше POPULAR_FEED_SIZE постов по индексу score.
+
+    С шардами - столько же с каждого шарда, слитые по score.
+    """
+    posts = with_comment_count(Post.objects.select_related(
+        "author", "group").filter(author__is_active=True))
+    if is_sharded():
+        return fan_in(posts, order=("score", "pk"),
+                      limit=settings.POPULAR_FEED_SIZE)
+    return posts.order_by("-score")[:settings.POPULAR_FEED_SIZE]
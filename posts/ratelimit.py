@@ -0,0 +1,123 @@
+import math
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+# замок ведра: сколько живёт и сколько его ждать, секунды
+LOCK_TIMEOUT = 1
+LOCK_WAIT = 0.05
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60): ёмкость ведра и за сколько секунд оно
+    пополняется целиком."""
+    count, _, period = rate.partition("/")
+    return int(count), PERIODS[period]
+
+
+def client_ip(request):
+    if settings.RATELIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def bucket_lock_key(key):
+    return f"ratelimit:{key}:lock"
+
+
+@contextmanager
+def locked(keys):
+    """Блокирует вёдра на время чтения и записи их состояния.
+
+    cache.add атомарен на memcached/redis, поэтому его и используем как
+    замок. Если замок не взять за LOCK_WAIT секунд (воркер упал, не
+    отпустив его), работаем без него: лимит важнее не потерять запрос.
+    """
+    taken = []
+    deadline = time.monotonic() + LOCK_WAIT
+    for key in sorted(keys):
+        while not cache.add(bucket_lock_key(key), 1, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.001)
+        else:
+            taken.append(bucket_lock_key(key))
+    try:
+        yield
+    finally:
+        cache.delete_many(taken)
+
+
+def take_tokens(buckets, now=None):
+    """Берёт по жетону из каждого ведра; 0 или через сколько секунд повторить.
+
+    buckets - пары (ключ, "10/m"). Ведро на capacity жетонов непрерывно
+    пополняется со скоростью capacity за период, в кэше лежат остаток
+    жетонов и время последнего пополнения. Жетоны списываются, только
+    если они есть во всех вёдрах сразу: отказ по одному ведру не тратит
+    остальные.
+    """
+    now = time.time() if now is None else now
+    keys = [f"ratelimit:{key}" for key, _ in buckets]
+    with locked(keys):
+        states = cache.get_many(keys)
+        refilled = {}
+        retry_after = 0
+        for cache_key, (_, rate) in zip(keys, buckets):
+            capacity, period = parse_rate(rate)
+            tokens, stamp = states.get(cache_key, (capacity, now))
+            tokens = min(capacity,
+                         tokens + (now - stamp) * capacity / period)
+            refilled[cache_key] = (tokens, capacity, period)
+            if tokens < 1:
+                retry_after = max(retry_after, max(1, math.ceil(
+                    (1 - tokens) * period / capacity)))
+        charge = 0 if retry_after else 1
+        for cache_key, (tokens, capacity, period) in refilled.items():
+            # за period ведро пополняется целиком, дольше хранить незачем
+            cache.set(cache_key, (tokens - charge, now), period + 1)
+    return retry_after
+
+
+def take_token(key, rate, now=None):
+    """Жетон из одного ведра, см. take_tokens."""
+    return take_tokens([(key, rate)], now)
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """Ограничивает запись по именам URL из settings.RATELIMITS.
+
+    Для каждого правила отдельно считаются вёдра на пользователя и на IP;
+    если пусто любое, отвечаем 429 с Retry-After и не тратим другое.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        rule = settings.RATELIMITS.get(match.url_name) if match else None
+        if rule is None:
+            return None
+        if request.method not in rule.get("methods", ("GET", "POST")):
+            return None
+
+        buckets = []
+        if rule.get("ip"):
+            buckets.append((f"ip:{client_ip(request)}", rule["ip"]))
+        if rule.get("user") and request.user.is_authenticated:
+            buckets.append((f"user:{request.user.pk}", rule["user"]))
+
+        retry_after = take_tokens([(f"{match.url_name}:{ident}", rate)
+                                   for ident, rate in buckets])
+        if not retry_after:
+            return None
+        response = HttpResponse("Слишком много запросов, попробуйте позже.",
+                                status=429,
+                                content_type="text/plain; charset=utf-8")
+        response["Retry-After"] = str(retry_after)
+        return response
@@ -0,0 +1,93 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import escape, format_html, urlize
+
+# поменять, если меняется результат render_text: старые тексты
+# перерисует manage.py rerender_posts
+RENDERER_VERSION = 1
+
+TOKEN_RE = re.compile(r"(\s+)")
+MENTION_RE = re.compile(r"^@([\w.@+-]+?)([.,:;!?)]*)$")
+TAG_RE = re.compile(r"^#([-\w]+?)([.,:;!?)]*)$")
+
+
+def references(texts):
+    """Имена из @упоминаний и слаги из #тегов, которые есть в базе.
+
+    Два запроса на любую пачку текстов.
+    """
+    from .models import Group
+
+    names, slugs = set(), set()
+    for text in texts:
+        for token in text.split():
+            for regex, found in ((MENTION_RE, names), (TAG_RE, slugs)):
+                match = regex.match(token)
+                if match:
+                    found.add(match.group(1))
+    if names:
+        names = set(get_user_model().objects.filter(
+            username__in=names, is_active=True)
+            .values_list("username", flat=True))
+    if slugs:
+        slugs = set(Group.objects.filter(slug__in=slugs)
+                    .values_list("slug", flat=True))
+    return names, slugs
+
+
+def render_token(token, names, slugs):
+    for regex, known, url_name in ((MENTION_RE, names, "profile"),
+                                   (TAG_RE, slugs, "group")):
+        match = regex.match(token)
+        if match and match.group(1) in known:
+            return format_html('<a href="{}">{}</a>{}',
+                               reverse(url_name, args=[match.group(1)]),
+                               match.group(0)[:len(match.group(1)) + 1],
+                               match.group(2))
+    return urlize(token, nofollow=True, autoescape=True)
+
+
+def render_text(text, names=None, slugs=None):
+    """Текст поста или комментария в HTML, как его показывают шаблоны.
+
+    Экранирование, ссылки, @упоминания и #сообщества, переносы строк.
+    """
+    if names is None or slugs is None:
+        names, slugs = references([text])
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    parts = []
+    for token in TOKEN_RE.split(text):
+        if not token or token.isspace():
+            parts.append(escape(token).replace("\n", "<br>"))
+        else:
+            parts.append(render_token(token, names, slugs))
+    return "".join(parts)
+
+
+def render_instance(instance, names=None, slugs=None):
+    instance.text_html = render_text(instance.text, names, slugs)
+    instance.render_version = RENDERER_VERSION
+
+
+def rerender_batch(model, after_pk=0, batch_size=500, using=None):
+    """Перерисовывает пачку строк со старой версией рендерера.
+
+    Идёт по pk после after_pk и возвращает pk последней строки пачки,
+    None - строк больше нет. using - шард, None - как решит роутер.
+    """
+    with transaction.atomic(using=using):
+        rows = list(model.objects.db_manager(using)
+                    .filter(pk__gt=after_pk,
+                            render_version__lt=RENDERER_VERSION)
+                    .order_by("pk").only("pk", "text")[:batch_size])
+        if not rows:
+            return None
+        names, slugs = references(row.text for row in rows)
+        for row in rows:
+            render_instance(row, names, slugs)
+        model.objects.db_manager(using).bulk_update(
+            rows, ["text_html", "render_version"])
+    return rows[-1].pk
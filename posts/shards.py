@@ -0,0 +1,345 @@
+"""Посты и комментарии, разложенные по базам по автору.
+
+Включается списком алиасов в settings.POST_SHARDS; пустой список - всё
+в default, роутер ни во что не вмешивается. С шардами:
+
+- пост живёт на шарде своего автора, комментарий - на шарде поста;
+  где чей шард, записано в AuthorShard (в default), новым авторам шард
+  выдаётся по author_id % len(POST_SHARDS);
+- пользователи и группы остаются в default и копируются на шарды, чтобы
+  там работали внешние ключи и JOIN'ы (select_related, author__is_active);
+- id постов и комментариев выдаёт общий IdSequence, поэтому они
+  уникальны по всем базам и не меняются при переезде;
+- ленты index, follow_index и group собираются со всех шардов
+  слиянием по pub_date (MergedPostList);
+- manage.py reshard переносит авторов, чей шард не совпадает с
+  вычисленным по текущему POST_SHARDS (после добавления или удаления
+  шарда и при первом включении). Карта в кэше воркеров живёт
+  SHARD_CACHE_TIMEOUT секунд, поэтому перенос идёт в два шага:
+  копия и переключение (move_author), а после ожидания - докопирование
+  записанного по старой карте и удаление старых копий (finish_move).
+
+Уведомления остаются в default и ссылаются на пост без ограничения в
+базе (db_constraint=False), посты к ним подбираются со всех шардов;
+задачи по конкретному посту (verify_image) помнят его базу.
+
+Запрос Post.objects без экземпляра роутер отправляет в default, поэтому
+код, которому нужны посты всех авторов (архив, «Популярное», дайджест,
+sitemap, счётчики сообществ, удаление картинок), проходит по всем базам
+(each_shard), а посты одного автора берёт с его шарда (on_author_shard,
+authors_by_shard). Админка постов и комментариев и её массовые правки
+видят только default.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max
+
+from .models import (ArchivedComment, ArchivedPost, AuthorShard, Comment,
+                     Group, IdSequence, Post)
+from . import stats
+
+User = get_user_model()
+
+SHARDED_MODELS = (Post, Comment)
+# справочники, которые копируются на каждый шард
+REPLICATED_MODELS = (User, Group)
+REPLICATE_BATCH_SIZE = 1000
+
+
+def is_sharded():
+    return bool(settings.POST_SHARDS)
+
+
+def all_aliases():
+    """Все базы, где могут быть посты: шарды и default."""
+    aliases = list(settings.POST_SHARDS)
+    if DEFAULT_DB_ALIAS not in aliases:
+        aliases.append(DEFAULT_DB_ALIAS)
+    return aliases
+
+
+def each_shard(queryset):
+    """queryset на каждой базе с постами; без шардов - он сам."""
+    if not is_sharded():
+        return [queryset]
+    return [queryset.using(alias) for alias in all_aliases()]
+
+
+def home_shard(author_id):
+    """Куда автор должен попасть при текущем списке шардов."""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    return settings.POST_SHARDS[author_id % len(settings.POST_SHARDS)]
+
+
+def shard_cache_key(author_id):
+    return f"shard:author:{author_id}"
+
+
+def shard_for(author_id):
+    """Где сейчас лежат посты автора."""
+    if not is_sharded() or author_id is None:
+        return DEFAULT_DB_ALIAS
+    key = shard_cache_key(author_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = placement(author_id)
+        cache.set(key, alias, settings.SHARD_CACHE_TIMEOUT)
+    return alias
+
+
+def placement(author_id):
+    """Шард автора по карте, мимо кэша."""
+    return (AuthorShard.objects.filter(author_id=author_id)
+            .values_list("alias", flat=True).first() or DEFAULT_DB_ALIAS)
+
+
+def authors_by_shard(author_ids):
+    """Авторы, разложенные по шардам одним запросом к карте.
+
+    Для фоновых задач: {алиас: [author_id, ...]}, кэш воркера не нужен.
+    """
+    author_ids = sorted(set(author_ids))
+    if not is_sharded():
+        return {DEFAULT_DB_ALIAS: author_ids} if author_ids else {}
+    aliases = dict(AuthorShard.objects.filter(author_id__in=author_ids)
+                   .values_list("author_id", "alias"))
+    shards = {}
+    for author_id in author_ids:
+        shards.setdefault(aliases.get(author_id, DEFAULT_DB_ALIAS),
+                          []).append(author_id)
+    return shards
+
+
+def on_author_shard(queryset, author_id):
+    """queryset на шарде, где сейчас посты автора author_id."""
+    if not is_sharded():
+        return queryset
+    return queryset.using(shard_for(author_id))
+
+
+def set_shard(author_id, alias):
+    AuthorShard.objects.update_or_create(author_id=author_id,
+                                         defaults={"alias": alias})
+    cache.delete(shard_cache_key(author_id))
+
+
+def author_posts(username):
+    """Post.objects на шарде автора username."""
+    if not is_sharded():
+        return Post.objects.all()
+    author_id = (User.objects.filter(username=username)
+                 .values_list("pk", flat=True).first())
+    if author_id is None:
+        return Post.objects.none()
+    return Post.objects.using(shard_for(author_id))
+
+
+def next_id(model):
+    """Следующий id из общего счётчика; начало - максимум по всем базам."""
+    archived = {Post: ArchivedPost, Comment: ArchivedComment}[model]
+    name = model._meta.label_lower
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not IdSequence.objects.filter(name=name).update(
+                value=F("value") + 1):
+            start = max([
+                queryset.aggregate(last=Max("pk"))["last"] or 0
+                for queryset in
+                [model.objects.using(alias) for alias in all_aliases()]
+                + [archived.objects.all()]])
+            IdSequence.objects.get_or_create(name=name,
+                                             defaults={"value": start})
+            IdSequence.objects.filter(name=name).update(
+                value=F("value") + 1)
+        return IdSequence.objects.values_list("value", flat=True).get(
+            name=name)
+
+
+def replica_fields(instance):
+    return {field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields}
+
+
+def replicate(instances, aliases=None):
+    """Копирует пользователей или группы на шарды (без сигналов)."""
+    instances = list(instances)
+    if not instances:
+        return
+    model = type(instances[0])
+    for alias in aliases or settings.POST_SHARDS:
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        manager = model._base_manager.using(alias)
+        existing = set(manager.filter(pk__in=[obj.pk for obj in instances])
+                       .values_list("pk", flat=True))
+        manager.bulk_create([model(**replica_fields(obj))
+                             for obj in instances
+                             if obj.pk not in existing])
+        for obj in instances:
+            if obj.pk in existing:
+                fields = replica_fields(obj)
+                fields.pop(model._meta.pk.attname)
+                manager.filter(pk=obj.pk).update(**fields)
+
+
+def drop_replica(instance):
+    for alias in settings.POST_SHARDS:
+        if alias != DEFAULT_DB_ALIAS:
+            type(instance)._base_manager.using(alias).filter(
+                pk=instance.pk).delete()
+
+
+def sync_replicas(alias):
+    """Копирует на шард всех пользователей и все группы пачками."""
+    for model in REPLICATED_MODELS:
+        last_pk = 0
+        while True:
+            batch = list(model._base_manager.using(DEFAULT_DB_ALIAS)
+                         .filter(pk__gt=last_pk)
+                         .order_by("pk")[:REPLICATE_BATCH_SIZE])
+            if not batch:
+                break
+            replicate(batch, [alias])
+            last_pk = batch[-1].pk
+
+
+def copy_author(author_id, source, target):
+    """Копирует на target посты автора и комментарии к ним из source.
+
+    Уже скопированное пропускается, так что повтор безопасен.
+    """
+    posts = list(Post.objects.using(source).filter(author_id=author_id))
+    comments = list(Comment.objects.using(source)
+                    .filter(post__author_id=author_id))
+    with transaction.atomic(using=target):
+        Post.objects.using(target).bulk_create(posts, ignore_conflicts=True)
+        Comment.objects.using(target).bulk_create(comments,
+                                                  ignore_conflicts=True)
+    return posts, comments
+
+
+def move_author(author_id, target):
+    """Копирует посты автора на шард target и переключает на него карту.
+
+    Старые копии остаются: воркеры ещё до SHARD_CACHE_TIMEOUT секунд
+    пишут по старой карте. Возвращает прежний шард или None, если
+    автор уже на target.
+    """
+    source = placement(author_id)
+    if source == target:
+        return None
+    copy_author(author_id, source, target)
+    set_shard(author_id, target)
+    return source
+
+
+def finish_move(author_id, source):
+    """Второй шаг переноса, когда старая карта истекла у всех воркеров.
+
+    Докопирует записанное на source после move_author и удаляет там
+    посты автора и комментарии к ним. Возвращает число постов.
+    """
+    target = placement(author_id)
+    if source == target:
+        return 0
+    posts, comments = copy_author(author_id, source, target)
+    with transaction.atomic(using=source), stats.stats_frozen():
+        Comment.objects.using(source).filter(
+            pk__in=[comment.pk for comment in comments]).delete()
+        Post.objects.using(source).filter(
+            pk__in=[post.pk for post in posts]).delete()
+    return len(posts)
+
+
+def fan_in(queryset, order=("pub_date", "pk"), limit=None):
+    """Лента со всех шардов; без шардов - сам queryset."""
+    if not is_sharded():
+        return queryset
+    return MergedPostList(*(queryset.using(alias) for alias in all_aliases()),
+                          order=order, limit=limit)
+
+
+class MergedPostList:
+    """Посты нескольких шардов как один список для Paginator.
+
+    Каждый queryset отсортирован по убыванию полей order (по умолчанию
+    pub_date); срез [start:stop] берёт из каждого шарда первые stop строк
+    и сливает их heapq.merge, так что страница стоит k запросов по
+    индексу, а не чтения всех баз. limit обрезает весь список, как срез
+    одного queryset'а.
+    """
+
+    def __init__(self, *querysets, order=("pub_date", "pk"), limit=None):
+        self.order = order
+        self.limit = limit
+        self.querysets = [queryset.order_by(*(f"-{field}" for field in order))
+                          for queryset in querysets]
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if self.limit is None:
+                self._count = sum(queryset.count()
+                                  for queryset in self.querysets)
+            else:
+                # считаем только верх каждого шарда, COUNT с LIMIT
+                self._count = min(sum(queryset[:self.limit].count()
+                                      for queryset in self.querysets),
+                                  self.limit)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        if stop is None or self.limit is not None:
+            stop = min(stop if stop is not None else self.count(),
+                       self.count())
+        merged = heapq.merge(
+            *(queryset[:stop] for queryset in self.querysets),
+            key=lambda post: tuple(getattr(post, field)
+                                   for field in self.order),
+            reverse=True)
+        return list(islice(merged, start, stop))
+
+
+class AuthorShardRouter:
+    """Отправляет посты и комментарии на шард автора, остальное - в default.
+
+    Без POST_SHARDS ничего не решает (None), и Django работает как с
+    одной базой.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded():
+            return None
+        if model not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if isinstance(instance, User):
+            # author.posts - шард автора; у комментариев автор не решает
+            return shard_for(instance.pk) if model is Post else None
+        if isinstance(instance, Comment):
+            post = Comment._meta.get_field("post").get_cached_value(
+                instance, None)
+            if post is not None and post._state.db:
+                return post._state.db
+        if isinstance(instance, SHARDED_MODELS):
+            if instance._state.db:
+                return instance._state.db
+            if isinstance(instance, Post):
+                return shard_for(instance.author_id)
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True if is_sharded() else None
@@ -0,0 +1,160 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import edge, ranking, rendering, shards, sitemap, stats
+from .follows import delete_follows, follow_changed
+from .models import ArchivedPost, Comment, Follow, Group, GroupStats, Post
+from .queries import author_sidebar_key
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Group)
+def group_created(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, using, **kwargs):
+    instance._old_group_id = None
+    if instance.pk is not None and not stats.is_frozen():
+        instance._old_group_id = (
+            Post.objects.using(using).filter(pk=instance.pk)
+            .values_list("group_id", flat=True).first())
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or stats.is_frozen():
+        return
+    old_group_id = None if created else instance._old_group_id
+    if old_group_id == instance.group_id:
+        return
+    if old_group_id is not None:
+        stats.post_removed(old_group_id, instance.author_id,
+                           instance.pub_date)
+    if instance.group_id is not None:
+        stats.post_added(instance.group_id, instance.author_id,
+                         instance.pub_date)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if instance.group_id is None or stats.is_frozen():
+        return
+    stats.post_removed(instance.group_id, instance.author_id,
+                       instance.pub_date)
+
+
+@receiver(pre_save, sender=Post)
+def initial_score(sender, instance, raw=False, **kwargs):
+    if instance.pk is None and not raw and not instance.score:
+        instance.score = ranking.event_score("post", instance.pub_date)
+
+
+@receiver(post_save, sender=Comment)
+def comment_added(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw and instance.post_id is not None:
+        ranking.bump_post(instance.post_id, "comment", instance.created,
+                          using=using)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(follow_changed, sender=Follow)
+def follow_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ranking.bump_latest_post(instance.author_id, "follow")
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def reset_author_sidebar(sender, instance, created=True, **kwargs):
+    # правка поста счётчиков не меняет
+    if created:
+        cache.delete(author_sidebar_key(instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(follow_changed, sender=Follow)
+def reset_follow_sidebars(sender, instance, **kwargs):
+    cache.delete_many([author_sidebar_key(instance.author_id),
+                       author_sidebar_key(instance.user_id)])
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def render_text(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rendering.render_instance(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    groups = {instance.group_id, getattr(instance, "_old_group_id", None)}
+    edge.invalidate(
+        "index", f"post-{instance.pk}", f"author-{instance.author_id}",
+        *(f"group-{group_id}" for group_id in groups if group_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    if instance.post_id is not None:
+        edge.invalidate(f"post-{instance.post_id}")
+
+
+# post_delete для Follow не слушаем: с ним unfollow не смог бы удалять
+# одним запросом. Отписка приходит через follow_changed, его шлют
+# unfollow() и delete_follows() - для админки, purge_user и каскада
+@receiver(post_save, sender=Follow)
+@receiver(follow_changed, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    edge.invalidate(f"author-{instance.author_id}",
+                    f"author-{instance.user_id}")
+
+
+@receiver(pre_delete, sender=User)
+def drop_user_follows(sender, instance, **kwargs):
+    # до каскада, который удалил бы подписки молча
+    delete_follows(Follow.objects.filter(Q(user_id=instance.pk) |
+                                         Q(author_id=instance.pk)))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def sitemap_changed(sender, instance, created=True, raw=False, **kwargs):
+    # правка текста адрес не меняет, а перенос в архив - тот же id
+    if created and not raw:
+        sitemap.mark_dirty(instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def shard_id(sender, instance, raw=False, **kwargs):
+    # автоинкремент у каждого шарда свой, id выдаёт общий счётчик
+    if instance.pk is None and not raw and shards.is_sharded():
+        instance.pk = shards.next_id(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def replicate_to_shards(sender, instance, created, raw=False, **kwargs):
+    if raw or not shards.is_sharded():
+        return
+    shards.replicate([instance])
+    if created and sender is User:
+        shards.set_shard(instance.pk, shards.home_shard(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def drop_from_shards(sender, instance, **kwargs):
+    if shards.is_sharded():
+        shards.drop_replica(instance)
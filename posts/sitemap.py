@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db.models import Max
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from yatube.storage import compress_file
+
+from .models import ArchivedPost, Post, SitemapShard
+from .shards import each_shard
+
+
+def shard_of(post_id):
+    return post_id // settings.SITEMAP_SHARD_SIZE
+
+
+def shard_name(number):
+    return f"sitemap-{number}.xml"
+
+
+def mark_dirty(post_id):
+    """Пост появился или исчез: его кусок sitemap надо пересобрать."""
+    number = shard_of(post_id)
+    if not SitemapShard.objects.filter(number=number).update(dirty=True):
+        SitemapShard.objects.update_or_create(number=number,
+                                              defaults={"dirty": True})
+
+
+def base_url():
+    return f"{settings.SITEMAP_PROTOCOL}://{Site.objects.get_current().domain}"
+
+
+def shard_urls(number):
+    """Адреса постов куска: диапазон по первичному ключу в обеих таблицах."""
+    start = number * settings.SITEMAP_SHARD_SIZE
+    end = start + settings.SITEMAP_SHARD_SIZE
+    rows = set()
+    # set: пост переехавшего автора до finish_move лежит на двух шардах
+    for queryset in [*each_shard(Post.objects.all()),
+                     ArchivedPost.objects.all()]:
+        rows.update(queryset
+                    .filter(pk__gte=start, pk__lt=end,
+                            author__is_active=True)
+                    .values_list("pk", "author__username", "pub_date"))
+    rows = sorted(rows)
+    return [(reverse("post", args=(username, pk)), pub_date)
+            for pk, username, pub_date in rows]
+
+
+def write_file(name, content):
+    """Пишет файл во временный и переименовывает: читатель не увидит
+    недописанный sitemap. Рядом кладётся .gz для serve_static."""
+    os.makedirs(settings.SITEMAP_ROOT, exist_ok=True)
+    path = os.path.join(settings.SITEMAP_ROOT, name)
+    fd, tmp = tempfile.mkstemp(dir=settings.SITEMAP_ROOT)
+    with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+        tmp_file.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+    compress_file(path)
+
+
+def build_shard(number, base):
+    urls = shard_urls(number)
+    path = os.path.join(settings.SITEMAP_ROOT, shard_name(number))
+    if urls:
+        write_file(shard_name(number), render_to_string(
+            "sitemaps/shard.xml", {"base": base, "urls": urls}))
+    else:
+        for stale in (path, path + ".gz", path + ".br"):
+            if os.path.exists(stale):
+                os.remove(stale)
+    lastmod = max((date for _, date in urls), default=None)
+    SitemapShard.objects.filter(number=number).update(urls=len(urls),
+                                                      lastmod=lastmod)
+    return len(urls)
+
+
+def build_index(base):
+    shards = (SitemapShard.objects.filter(urls__gt=0).order_by("number")
+              .values_list("number", "lastmod"))
+    write_file("sitemap.xml", render_to_string("sitemaps/index.xml", {
+        "base": base,
+        "shards": [(shard_name(number), lastmod)
+                   for number, lastmod in shards],
+    }))
+
+
+def build_sitemap(full=False):
+    """Пересобирает грязные куски и индекс; возвращает число кусков.
+
+    Флаг снимается до сборки: если пост изменится во время записи,
+    кусок снова станет грязным и соберётся в следующий раз.
+    """
+    if full:
+        last = max(filter(None, (
+            queryset.aggregate(last=Max("pk"))["last"] for queryset in
+            [*each_shard(Post.objects.all()), ArchivedPost.objects.all()])),
+            default=None)
+        if last is not None:
+            for number in range(shard_of(last) + 1):
+                mark_dirty(number * settings.SITEMAP_SHARD_SIZE)
+    numbers = list(SitemapShard.objects.filter(dirty=True)
+                   .order_by("number").values_list("number", flat=True))
+    index_path = os.path.join(settings.SITEMAP_ROOT, "sitemap.xml")
+    if not numbers and os.path.exists(index_path):
+        return 0
+    SitemapShard.objects.filter(number__in=numbers).update(dirty=False)
+    base = base_url()
+    for number in numbers:
+        build_shard(number, base)
+    build_index(base)
+    return len(numbers)
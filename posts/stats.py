@@ -0,0 +1,154 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Coalesce, Greatest
+
+from . import shards
+from .models import (ArchivedPost, Group, GroupAuthorStats, GroupStats,
+                     Post)
+
+TOP_AUTHORS = 3
+
+_state = threading.local()
+
+
+@contextmanager
+def stats_frozen():
+    """Не трогать счётчики: посты не исчезают, а переезжают (архив)."""
+    _state.frozen = True
+    try:
+        yield
+    finally:
+        _state.frozen = False
+
+
+def is_frozen():
+    return getattr(_state, "frozen", False)
+
+
+def refresh_top_authors(group_id):
+    # отключённые авторы ждут удаления (purge_user), их не показываем
+    names = (GroupAuthorStats.objects
+             .filter(group_id=group_id, post_count__gt=0,
+                     author__is_active=True)
+             .order_by("-post_count", "author_id")
+             .values_list("author__username", flat=True)[:TOP_AUTHORS])
+    GroupStats.objects.filter(group_id=group_id).update(
+        top_authors=",".join(names))
+
+
+def bump_author(group_id, author_id, delta):
+    updated = GroupAuthorStats.objects.filter(
+        group_id=group_id, author_id=author_id).update(
+        post_count=F("post_count") + delta)
+    if updated or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            GroupAuthorStats.objects.create(group_id=group_id,
+                                            author_id=author_id,
+                                            post_count=delta)
+    except IntegrityError:
+        # строку успел создать параллельный запрос
+        bump_author(group_id, author_id, delta)
+
+
+def post_added(group_id, author_id, pub_date):
+    GroupStats.objects.get_or_create(group_id=group_id)
+    GroupStats.objects.filter(group_id=group_id).update(
+        post_count=F("post_count") + 1,
+        last_post_date=Greatest(Coalesce("last_post_date", pub_date),
+                                pub_date))
+    bump_author(group_id, author_id, 1)
+    refresh_top_authors(group_id)
+
+
+def post_removed(group_id, author_id, pub_date):
+    GroupStats.objects.filter(group_id=group_id, post_count__gt=0).update(
+        post_count=F("post_count") - 1)
+    stats = GroupStats.objects.filter(group_id=group_id).first()
+    if stats is not None and stats.last_post_date == pub_date:
+        # удалили самый свежий пост - берём следующий по индексу
+        GroupStats.objects.filter(group_id=group_id).update(
+            last_post_date=latest_post_date(group_id))
+    bump_author(group_id, author_id, -1)
+    refresh_top_authors(group_id)
+
+
+def latest_post_date(group_id):
+    dates = [queryset.filter(group_id=group_id)
+             .aggregate(latest=Max("pub_date"))["latest"]
+             for queryset in [*shards.each_shard(Post.objects.all()),
+                              ArchivedPost.objects.all()]]
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+
+def post_deltas(posts, sign):
+    """Пары (group_id, author_id) постов -> изменения для apply_deltas."""
+    return Counter({key: sign * count
+                    for key, count in Counter(posts).items()})
+
+
+def apply_deltas(deltas):
+    """Сдвигает счётчики сразу на пачку изменений.
+
+    deltas - {(group_id, author_id): изменение числа постов}; запросов
+    столько, сколько затронуто пар и групп, а не постов.
+    """
+    groups = defaultdict(int)
+    for (group_id, author_id), delta in deltas.items():
+        if group_id is None:
+            continue
+        groups[group_id] += delta
+        if delta:
+            bump_author(group_id, author_id, delta)
+    for group_id, delta in groups.items():
+        GroupStats.objects.get_or_create(group_id=group_id)
+        GroupStats.objects.filter(group_id=group_id).update(
+            post_count=Greatest(F("post_count") + delta, 0),
+            last_post_date=latest_post_date(group_id))
+        refresh_top_authors(group_id)
+
+
+def rebuild_group_stats():
+    """Полный пересчёт счётчиков, включая архивные посты."""
+    counts = {}
+    for queryset in [*shards.each_shard(Post.objects.all()),
+                     ArchivedPost.objects.all()]:
+        rows = (queryset.filter(group__isnull=False)
+                .values("group_id", "author_id")
+                .annotate(posts=Count("pk"), latest=Max("pub_date")))
+        for row in rows:
+            key = (row["group_id"], row["author_id"])
+            posts, latest = counts.get(key, (0, None))
+            if latest is None or row["latest"] > latest:
+                latest = row["latest"]
+            counts[key] = (posts + row["posts"], latest)
+
+    with transaction.atomic():
+        GroupAuthorStats.objects.all().delete()
+        GroupAuthorStats.objects.bulk_create(
+            GroupAuthorStats(group_id=group_id, author_id=author_id,
+                             post_count=posts)
+            for (group_id, author_id), (posts, _) in counts.items())
+        groups = {}
+        for (group_id, _), (posts, latest) in counts.items():
+            total, last = groups.get(group_id, (0, None))
+            if last is None or latest > last:
+                last = latest
+            groups[group_id] = (total + posts, last)
+        GroupStats.objects.bulk_create(
+            GroupStats(group_id=group_id) for group_id in
+            Group.objects.filter(stats__isnull=True)
+            .values_list("pk", flat=True))
+        GroupStats.objects.all().update(post_count=0, last_post_date=None,
+                                        top_authors="")
+        for group_id, (total, last) in groups.items():
+            GroupStats.objects.update_or_create(
+                group_id=group_id,
+                defaults={"post_count": total, "last_post_date": last})
+            refresh_top_authors(group_id)
@@ -0,0 +1,24 @@
+import json
+
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **kwargs):
+    """Фрагмент, который зависит от пользователя.
+
+    Обычно просто подключает template_name с kwargs. Когда страница
+    рисуется для общего кэша (posts/pagecache.py), вместо фрагмента
+    остаётся метка, а заполняет её fill_holes для каждого запроса.
+    """
+    request = context.get("request")
+    if getattr(request, "punch_holes", False):
+        marker = escape(json.dumps([template_name, kwargs]))
+        return mark_safe(f"<!--hole {marker}-->")
+    fragment = context.template.engine.get_template(template_name)
+    with context.push(**kwargs):
+        return fragment.render(context)
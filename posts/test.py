@@ -1,15 +1,38 @@
+import io
+import json
+import os
 import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
 
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
 from django.shortcuts import reverse
-from django.test import Client, TestCase
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase)
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from .models import Comment, Follow, Group, Post
+from . import (counters, digest, edge, export, follows, purge, ranking,
+               rendering, shards)
+from .edge import PurgeClient
+from .jobs import run_batch, run_pending
+from .models import (ArchivedPost, Comment, Follow, Group, GroupStats, Job,
+                     Notification, Post)
+from .pagecache import page_cache_key, shared_page_cache
+from .queries import author_sidebar_key
+from .ratelimit import take_token
+from .sitemap import build_sitemap
 
 
 def get_test_image_file():
@@ -366,3 +389,1275 @@ class CommentTest(TestCase):
 
         self.assertNotIn("simple text post favorite author",
                          follow_index_page.content.decode())
+
+
+@override_settings(CACHES=settings.TEST_CACHES,
+                   MEDIA_ROOT=tempfile.mkdtemp())
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="sarah")
+        self.other = User.objects.create_user(username="james")
+        self.client.force_login(self.user)
+
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(name='pic.png', content=b'png' * 100,
+                                     content_type='image/png'))
+        Post.objects.create(text='Второй пост', author=self.user)
+        Post.objects.create(text='Чужой пост', author=self.other)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Мой комментарий')
+        Follow.objects.create(user=self.user, author=self.other)
+
+    # Архив отдаётся потоком и содержит только данные владельца
+    def test_export_archive(self):
+        response = self.client.get(reverse('profile_export',
+                                           args=(self.user.username,)))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        posts = [json.loads(line) for line in
+                 archive.read('posts.jsonl').decode().splitlines()]
+        self.assertEqual(sorted(p['text'] for p in posts),
+                         ['Второй пост', 'Пост с картинкой'])
+        comments = archive.read('comments.jsonl').decode()
+        self.assertIn('Мой комментарий', comments)
+        follows = archive.read('follows.jsonl').decode()
+        self.assertIn('james', follows)
+        self.assertEqual(archive.read(self.post.image.name), b'png' * 100)
+
+    def test_cannot_export_other_user(self):
+        response = self.client.get(reverse('profile_export',
+                                           args=(self.other.username,)))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="sarah")
+        self.client.force_login(self.user)
+
+        self.old_post = Post.objects.create(text='старый пост',
+                                            author=self.user)
+        Comment.objects.create(post=self.old_post, author=self.user,
+                               text='старый комментарий')
+        Post.objects.filter(pk=self.old_post.pk).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        self.new_post = Post.objects.create(text='новый пост',
+                                            author=self.user)
+
+    def test_archive_moves_old_posts_with_comments(self):
+        call_command('archive_posts', days=90, compress=True,
+                     stdout=io.StringIO())
+
+        self.assertFalse(Post.objects.filter(pk=self.old_post.pk).exists())
+        archived = ArchivedPost.objects.get(pk=self.old_post.pk)
+        self.assertIsNotNone(archived.compressed_text)
+        self.assertEqual(archived.text, 'старый пост')
+        self.assertEqual(archived.comments.get().text, 'старый комментарий')
+        self.assertTrue(Post.objects.filter(pk=self.new_post.pk).exists())
+
+    # Лента читает только горячую таблицу, профиль и пост - обе
+    def test_views_fall_back_to_archive(self):
+        call_command('archive_posts', days=90, stdout=io.StringIO())
+
+        index = self.client.get(reverse('index'))
+        self.assertNotContains(index, 'старый пост')
+
+        profile = self.client.get(reverse('profile', args=('sarah',)))
+        self.assertEqual(profile.context['paginator'].count, 2)
+        self.assertEqual([post.text for post in profile.context['page']],
+                         ['новый пост', 'старый пост'])
+
+        post = self.client.get(reverse('post',
+                                       args=('sarah', self.old_post.pk)))
+        self.assertEqual(post.status_code, 200)
+        self.assertContains(post, 'старый комментарий')
+        self.assertNotContains(post, 'Редактировать')
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class GroupStatsTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        self.dogs = Group.objects.create(title="Собаки", slug="dogs")
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    # Счётчики меняются при создании, переносе и удалении поста
+    def test_stats_follow_post_changes(self):
+        first = Post.objects.create(text='1', author=self.sarah,
+                                    group=self.cats)
+        second = Post.objects.create(text='2', author=self.james,
+                                     group=self.cats)
+        Post.objects.create(text='3', author=self.james, group=self.cats)
+        cats = self.stats(self.cats)
+        self.assertEqual(cats.post_count, 3)
+        self.assertEqual(cats.top_author_names, ['james', 'sarah'])
+
+        second.group = self.dogs
+        second.save()
+        self.assertEqual(self.stats(self.cats).post_count, 2)
+        self.assertEqual(self.stats(self.dogs).post_count, 1)
+        self.assertEqual(self.stats(self.dogs).last_post_date,
+                         second.pub_date)
+
+        first.delete()
+        cats = self.stats(self.cats)
+        self.assertEqual(cats.post_count, 1)
+        self.assertEqual(cats.top_author_names, ['james'])
+
+        second.delete()
+        self.assertIsNone(self.stats(self.dogs).last_post_date)
+
+    def test_rebuild_matches_incremental(self):
+        Post.objects.create(text='1', author=self.sarah, group=self.cats)
+        Post.objects.create(text='2', author=self.james, group=self.dogs)
+        before = list(GroupStats.objects.order_by('pk').values())
+        call_command('rebuild_group_stats', stdout=io.StringIO())
+        self.assertEqual(list(GroupStats.objects.order_by('pk').values()),
+                         before)
+
+    # Страница сообществ - это один запрос
+    def test_group_index_is_one_query(self):
+        Post.objects.create(text='1', author=self.sarah, group=self.cats)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('group_index'))
+        self.assertContains(response, 'Коты')
+        self.assertContains(response, 'Записей: 1')
+        self.assertContains(response, 'Записей пока нет')
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit-test'}},
+    RATELIMITS={'new_post': {'user': '2/m', 'ip': '3/m',
+                             'methods': ('POST',)}})
+class RateLimitTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.client_sarah = Client()
+        self.client_sarah.force_login(self.sarah)
+        self.client_james = Client()
+        self.client_james.force_login(self.james)
+
+    def post(self, client):
+        return client.post(reverse('new_post'), {'text': 'спам'})
+
+    # Сверх лимита пользователь получает 429 с Retry-After
+    def test_user_limit(self):
+        self.assertEqual(self.post(self.client_sarah).status_code, 302)
+        self.assertEqual(self.post(self.client_sarah).status_code, 302)
+        response = self.post(self.client_sarah)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(Post.objects.filter(author=self.sarah).count(), 2)
+
+        # GET формы не ограничивается
+        response = self.client_sarah.get(reverse('new_post'))
+        self.assertEqual(response.status_code, 200)
+
+    # Общий IP ограничен отдельно от пользователей
+    def test_ip_limit(self):
+        self.post(self.client_sarah)
+        self.post(self.client_sarah)
+        self.assertEqual(self.post(self.client_james).status_code, 302)
+        self.assertEqual(self.post(self.client_james).status_code, 429)
+
+    # Отказ по ведру пользователя не тратит жетон IP
+    def test_rejected_request_spends_nothing(self):
+        for _ in range(3):
+            self.post(self.client_sarah)
+        self.assertEqual(self.post(self.client_james).status_code, 302)
+        self.assertEqual(self.post(self.client_james).status_code, 429)
+
+    def test_bucket_refills_next_period(self):
+        self.assertEqual(take_token('key', '1/m', now=60), 0)
+        self.assertEqual(take_token('key', '1/m', now=90), 30)
+        self.assertEqual(take_token('key', '1/m', now=120), 0)
+
+    # На стыке периодов лимит не удваивается
+    def test_no_burst_across_boundary(self):
+        for now in (59, 59.5):
+            self.assertEqual(take_token('edge', '2/m', now=now), 0)
+        self.assertGreater(take_token('edge', '2/m', now=60), 28)
+        self.assertEqual(take_token('edge', '2/m', now=90), 0)
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'notifications-test'}},
+    JOBS_BATCH_SIZE=2)
+class NotificationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="sarah")
+        self.followers = [User.objects.create_user(username=f"fan{i}")
+                          for i in range(5)]
+        for follower in self.followers:
+            Follow.objects.create(user=follower, author=self.author)
+        self.client_author = Client()
+        self.client_author.force_login(self.author)
+        self.client_fan = Client()
+        self.client_fan.force_login(self.followers[0])
+
+    # Рассылка идёт фоновой задачей пачками, а не в запросе
+    def test_new_post_fans_out_in_batches(self):
+        self.client_author.post(reverse('new_post'), {'text': 'новость'})
+        self.assertEqual(Notification.objects.count(), 0)
+        job = Job.objects.get(kind='notify_followers')
+        self.assertIsNone(job.total)
+
+        self.assertEqual(run_batch(job), 2)
+        self.assertEqual(job.total, 5)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+        run_pending()
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('recipient__username',
+                                                    flat=True)),
+            [f'fan{i}' for i in range(5)])
+
+    def test_unread_count_and_badge(self):
+        self.client_author.post(reverse('new_post'), {'text': 'новость'})
+        response = self.client_fan.get(reverse('notifications_unread'))
+        self.assertEqual(response.json(), {'unread': 0})
+
+        run_pending()
+        response = self.client_fan.get(reverse('notifications_unread'))
+        self.assertEqual(response.json(), {'unread': 1})
+
+        # счётчик в меню берётся из кэша, без запроса к уведомлениям
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_fan.get(reverse('index'))
+        self.assertContains(response, 'badge')
+        self.assertFalse(any('posts_notification' in q['sql']
+                             for q in queries))
+
+        response = self.client_fan.get(reverse('notifications'))
+        self.assertContains(response, 'Новая запись')
+        response = self.client_fan.get(reverse('notifications_unread'))
+        self.assertEqual(response.json(), {'unread': 0})
+
+    # Прочитанными становятся только уведомления показанной страницы
+    def test_only_shown_page_is_read(self):
+        post = Post.objects.create(text='новость', author=self.author)
+        Notification.objects.bulk_create(
+            Notification(recipient=self.followers[0], post=post)
+            for _ in range(25))
+        self.client_fan.get(reverse('notifications'))
+        response = self.client_fan.get(reverse('notifications_unread'))
+        self.assertEqual(response.json(), {'unread': 5})
+
+
+class DigestTest(TestCase):
+
+    def setUp(self):
+        self.authors = [User.objects.create_user(username=f"writer{i}")
+                        for i in range(3)]
+        self.readers = [
+            User.objects.create_user(username=f"reader{i}",
+                                     email=f"reader{i}@yatube.ru")
+            for i in range(4)]
+        for reader in self.readers[:3]:
+            for author in self.authors:
+                Follow.objects.create(user=reader, author=author)
+        for author in self.authors:
+            Post.objects.create(text=f"свежее от {author.username}",
+                                author=author)
+        old = Post.objects.create(text="давнее", author=self.authors[0])
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - timedelta(days=3))
+
+    # Письма получают только подписчики, в письме только свежие посты
+    def test_digest(self):
+        call_command('send_digest', period='daily', chunk_size=2,
+                     stdout=io.StringIO())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f"reader{i}@yatube.ru" for i in range(3)])
+        body = mail.outbox[0].body
+        for author in self.authors:
+            self.assertIn(f"свежее от {author.username}", body)
+        self.assertNotIn("давнее", body)
+
+        mail.outbox = []
+        call_command('send_digest', period='weekly', stdout=io.StringIO())
+        self.assertIn("давнее", mail.outbox[0].body)
+
+        # удалённый аккаунт ждёт purge_user, в письма он не попадает
+        User.objects.filter(pk=self.authors[0].pk).update(is_active=False)
+        mail.outbox = []
+        call_command('send_digest', period='daily', stdout=io.StringIO())
+        self.assertNotIn("writer0", mail.outbox[0].body)
+
+    # Число запросов не зависит от числа авторов в подписках
+    def test_queries_per_chunk(self):
+        with CaptureQueriesContext(connection) as few:
+            call_command('send_digest', chunk_size=10, stdout=io.StringIO())
+        for i in range(3, 8):
+            author = User.objects.create_user(username=f"writer{i}")
+            Post.objects.create(text="ещё", author=author)
+            Follow.objects.create(user=self.readers[0], author=author)
+        with CaptureQueriesContext(connection) as many:
+            call_command('send_digest', chunk_size=10, stdout=io.StringIO())
+        self.assertEqual(len(few), len(many))
+
+
+@override_settings(CACHES=settings.TEST_CACHES, ADMIN_EXACT_COUNT_LIMIT=5)
+class AdminTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="boss", email="boss@yatube.ru", password="12345")
+        self.client.force_login(self.admin)
+        self.author = User.objects.create_user(username="kate")
+        self.group = Group.objects.create(title="group", slug="group")
+
+    def make_posts(self, count):
+        posts = Post.objects.bulk_create(
+            Post(text=f"пост {i}", author=self.author, group=self.group)
+            for i in range(count))
+        for post in Post.objects.all()[:count]:
+            Comment.objects.create(post=post, author=self.author, text="к")
+        return posts
+
+    # Список не делает запросов на каждую строку
+    def test_changelist_queries_do_not_grow(self):
+        self.make_posts(6)
+        url = reverse('admin:posts_post_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        self.make_posts(20)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(many))
+        self.assertFalse(any(q['sql'].startswith('SELECT COUNT(*)')
+                             and 'WHERE' not in q['sql']
+                             for q in many))
+
+        with CaptureQueriesContext(connection) as comments:
+            response = self.client.get(
+                reverse('admin:posts_comment_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(comments), 10)
+
+    # Число ищет по id, «@имя» - по автору, остальное - по тексту
+    def test_search(self):
+        self.make_posts(3)
+        post = Post.objects.first()
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url, {'q': str(post.pk)})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(url, {'q': '@kate'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(url, {'q': 'пост 1'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': str(post.pk)})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+@override_settings(CACHES=settings.TEST_CACHES, JOBS_BATCH_SIZE=2)
+class BulkActionTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username="boss", email="boss@yatube.ru", password="12345")
+        self.client.force_login(self.admin)
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        self.dogs = Group.objects.create(title="Собаки", slug="dogs")
+        for i in range(5):
+            Post.objects.create(text=f"кот {i}", group=self.cats,
+                                author=self.sarah if i % 2 else self.james)
+
+    def act(self, action, ids, **data):
+        return self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': action, '_selected_action': ids, **data})
+
+    def assert_stats_consistent(self):
+        incremental = list(GroupStats.objects.order_by('pk').values())
+        call_command('rebuild_group_stats', stdout=io.StringIO())
+        self.assertEqual(incremental,
+                         list(GroupStats.objects.order_by('pk').values()))
+
+    # Действие только ставит задачу, работа идёт пачками
+    def test_move_to_group(self):
+        ids = list(Post.objects.values_list('pk', flat=True)[:4])
+        self.act('move_to_group', ids, group=self.dogs.pk)
+        self.assertEqual(Post.objects.filter(group=self.dogs).count(), 0)
+
+        job = Job.objects.get(kind='admin_bulk')
+        self.assertEqual(run_batch(job), 2)
+        self.assertEqual(Post.objects.filter(group=self.dogs).count(), 2)
+        response = self.client.get(reverse('admin:posts_job_changelist'))
+        self.assertContains(response, '50%')
+
+        run_pending()
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+        self.assertEqual(Post.objects.filter(group=self.dogs).count(), 4)
+        self.assertEqual(GroupStats.objects.get(group=self.cats).post_count,
+                         1)
+        self.assert_stats_consistent()
+
+    def test_delete_and_reassign(self):
+        ids = list(Post.objects.filter(author=self.james)
+                   .values_list('pk', flat=True))
+        self.act('reassign_author', ids, author='sarah')
+        run_pending()
+        self.assertEqual(self.james.posts.count(), 0)
+        self.assert_stats_consistent()
+
+        self.act('delete_in_background', ids[:2])
+        self.assertEqual(Post.objects.count(), 5)
+        run_pending()
+        self.assertEqual(Post.objects.count(), 3)
+        self.assert_stats_consistent()
+
+    # В задаче условие выборки, а не id; правка сбрасывает кэши авторов
+    def test_payload_and_invalidation(self):
+        ids = list(Post.objects.filter(author=self.james)
+                   .values_list('pk', flat=True))
+        self.act('reassign_author', ids, author='sarah')
+        job = Job.objects.get(kind='admin_bulk')
+        self.assertNotIn('ids', job.get_payload())
+        self.assertIsNone(job.total)
+        sidebars = [author_sidebar_key(self.james.pk),
+                    author_sidebar_key(self.sarah.pk)]
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'bulk-test'}}):
+            cache.set_many(dict.fromkeys(sidebars, 'старое'))
+            run_pending()
+            self.assertEqual(cache.get_many(sidebars), {})
+        self.assertEqual(Job.objects.get(pk=job.pk).total, len(ids))
+
+    def test_unknown_author(self):
+        ids = list(Post.objects.values_list('pk', flat=True))
+        response = self.act('reassign_author', ids, author='nobody')
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=settings.TEST_CACHES, JOBS_BATCH_SIZE=2)
+class AccountDeleteTest(TestCase):
+
+    def setUp(self):
+        self.sarah = User.objects.create_user(username="sarah",
+                                              password="12345")
+        self.james = User.objects.create_user(username="james")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        self.posts = [Post.objects.create(text=f"пост {i}", author=self.sarah,
+                                          group=self.cats)
+                      for i in range(3)]
+        self.other = Post.objects.create(text="чужой", author=self.james,
+                                         group=self.cats)
+        Comment.objects.create(post=self.posts[0], author=self.james,
+                               text="ответ")
+        Comment.objects.create(post=self.other, author=self.sarah,
+                               text="соседу")
+        Follow.objects.create(user=self.james, author=self.sarah)
+        Follow.objects.create(user=self.sarah, author=self.james)
+        self.client.force_login(self.sarah)
+
+    # Пользователь пропадает сразу, а данные удаляются пачками в фоне
+    def test_soft_delete_then_purge(self):
+        response = self.client.post(reverse('profile_delete',
+                                            args=['sarah']))
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(self.client.get(reverse('new_post')).status_code,
+                         302)
+        self.assertEqual(Post.objects.filter(author=self.sarah).count(), 3)
+
+        guest = Client()
+        self.assertEqual(guest.get(reverse('profile', args=['sarah']))
+                         .status_code, 404)
+        self.assertEqual(guest.get(reverse('post', args=[
+            'sarah', self.posts[0].pk])).status_code, 404)
+        self.assertNotContains(guest.get(reverse('index')), 'пост 0')
+        response = guest.get(reverse('post', args=['james', self.other.pk]))
+        self.assertNotContains(response, 'соседу')
+
+        job = Job.objects.get(kind='purge_user')
+        self.assertIsNone(job.total)
+        self.assertEqual(run_batch(job), 1)
+        self.assertTrue(User.objects.filter(username='sarah').exists())
+        self.assertEqual(GroupStats.objects.get(group=self.cats).top_authors,
+                         'james')
+        run_pending()
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+        self.assertEqual(Job.objects.get(pk=job.pk).progress, 100)
+        self.assertFalse(User.objects.filter(username='sarah').exists())
+        self.assertEqual(list(Post.objects.all()), [self.other])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(GroupStats.objects.get(group=self.cats).post_count,
+                         1)
+
+    def test_only_owner_can_delete(self):
+        response = self.client.post(reverse('profile_delete',
+                                            args=['james']))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(User.objects.get(username='james').is_active)
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class PopularTest(TestCase):
+
+    def setUp(self):
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.old = Post.objects.create(text="старый", author=self.sarah)
+        self.new = Post.objects.create(text="новый", author=self.james)
+
+    def ranked(self):
+        return list(Post.objects.order_by('-score').values_list('text',
+                                                                flat=True))
+
+    # Комментарии и подписчики поднимают пост, свежесть тоже учитывается
+    def test_score_updates_incrementally(self):
+        self.assertEqual(self.ranked(), ['новый', 'старый'])
+        Comment.objects.create(post=self.old, author=self.james, text="!")
+        self.assertEqual(self.ranked(), ['старый', 'новый'])
+        Follow.objects.create(user=self.sarah, author=self.james)
+        self.assertEqual(self.ranked(), ['новый', 'старый'])
+
+        later = Post.objects.create(text="завтрашний", author=self.sarah)
+        Post.objects.filter(pk=later.pk).update(
+            score=ranking.event_score(
+                'post', timezone.now() + timedelta(days=1)))
+        self.assertEqual(self.ranked()[0], 'завтрашний')
+
+    # Лента читает только верх индекса, сколько бы постов ни было
+    @override_settings(POPULAR_FEED_SIZE=3)
+    def test_feed_is_capped(self):
+        for i in range(5):
+            Post.objects.create(text=f"пост {i}", author=self.sarah)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('popular'))
+        self.assertEqual(response.context['paginator'].count, 3)
+        self.assertContains(response, 'пост 4')
+        self.assertNotContains(response, 'старый')
+        self.assertTrue(all('LIMIT' in q['sql'] for q in queries
+                            if 'posts_post' in q['sql']))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'post-view-test'}},
+    VIEW_FLUSH_EVERY=10 ** 6, VIEW_FLUSH_INTERVAL=10 ** 6)
+class PostViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.post = Post.objects.create(text="пост", author=self.sarah)
+        Comment.objects.create(post=self.post, author=self.james, text="!")
+        self.url = reverse('post', args=['sarah', self.post.pk])
+
+    # Пост с автором и числом комментариев - один запрос, плюс комментарии
+    def test_two_queries_with_cached_sidebar(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, '1 комментариев')
+        self.assertContains(response, 'Подписчиков:\n                0')
+
+        Follow.objects.create(user=self.james, author=self.sarah)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Подписчиков:\n                1')
+        Post.objects.create(text="ещё", author=self.sarah)
+        self.assertContains(self.client.get(self.url), 'Записей: 2')
+
+    def test_wrong_username(self):
+        response = self.client.get(reverse('post',
+                                           args=['james', self.post.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class RenderingTest(TestCase):
+
+    def setUp(self):
+        self.sarah = User.objects.create_user(username="sarah")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+
+    # HTML готовится при сохранении: экранирование, ссылки, упоминания
+    def test_rendered_on_save(self):
+        post = Post.objects.create(
+            author=self.sarah,
+            text="<b>привет</b>, @sarah и @nobody!\nсм. https://ya.ru #cats")
+        self.assertEqual(post.render_version, rendering.RENDERER_VERSION)
+        html = post.text_html
+        self.assertIn("&lt;b&gt;привет&lt;/b&gt;", html)
+        self.assertIn('<a href="/sarah/">@sarah</a>', html)
+        self.assertIn("@nobody!", html)
+        self.assertIn("<br>", html)
+        self.assertIn('href="https://ya.ru"', html)
+        self.assertIn('<a href="/group/cats/">#cats</a>', html)
+
+        comment = Comment.objects.create(post=post, author=self.sarah,
+                                         text="<i>ок</i>")
+        response = self.client.get(reverse('post', args=['sarah', post.pk]))
+        self.assertContains(response, html, html=False)
+        self.assertContains(response, "&lt;i&gt;ок&lt;/i&gt;")
+        self.assertEqual(comment.render_version, rendering.RENDERER_VERSION)
+
+    # Тексты старой версии перерисовывает команда, пачками
+    def test_rerender_command(self):
+        for i in range(3):
+            Post.objects.create(author=self.sarah, text=f"#cats {i}")
+        Post.objects.update(text_html="", render_version=0)
+        call_command('rerender_posts', batch_size=2, stdout=io.StringIO())
+        self.assertFalse(Post.objects.filter(
+            render_version__lt=rendering.RENDERER_VERSION).exists())
+        self.assertIn('/group/cats/', Post.objects.first().text_html)
+
+
+class StubProxy(BaseHTTPRequestHandler):
+    """Прокси-заглушка: запоминает ключи из запросов очистки."""
+    purged = []
+
+    def do_PURGE(self):
+        StubProxy.purged.append(self.headers["Surrogate-Key"].split())
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class EdgeCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubProxy)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        StubProxy.purged = []
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        self.post = Post.objects.create(text="пост", author=self.sarah,
+                                        group=self.cats)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def purge_url(self):
+        return "http://127.0.0.1:%d/purge" % self.server.server_port
+
+    # Аноним получает публичный ответ с ключами, вошедший - приватный
+    def test_headers(self):
+        response = self.client.get(reverse('group', args=['cats']))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(response['Surrogate-Key'],
+                         f'group-{self.cats.pk} post-{self.post.pk}')
+        response = self.client.get(reverse('post', args=['sarah',
+                                                         self.post.pk]))
+        self.assertEqual(response['Surrogate-Key'],
+                         f'post-{self.post.pk} author-{self.sarah.pk}')
+
+        self.client.force_login(self.james)
+        response = self.client.get(reverse('index'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertFalse(response.has_header('Surrogate-Key'))
+
+    # Изменения одной транзакции уходят к прокси одной задачей
+    def test_purge_is_batched_per_transaction(self):
+        with self.settings(EDGE_PURGE_URL=self.purge_url()):
+            with transaction.atomic():
+                Comment.objects.create(post=self.post, author=self.james,
+                                       text="!")
+                Follow.objects.create(user=self.james, author=self.sarah)
+            self.assertEqual(StubProxy.purged, [])
+            self.assertEqual(run_pending(), 1)
+            self.assertEqual(StubProxy.purged, [sorted([
+                f'post-{self.post.pk}', f'author-{self.sarah.pk}',
+                f'author-{self.james.pk}'])])
+
+            StubProxy.purged = []
+            post_id = self.post.pk
+            self.post.delete()
+            run_pending()
+        self.assertEqual(StubProxy.purged, [sorted([
+            'index', f'post-{post_id}', f'author-{self.sarah.pk}',
+            f'group-{self.cats.pk}'])])
+
+    def test_client_splits_batches_and_survives_errors(self):
+        client = PurgeClient(url=self.purge_url(), batch_size=2)
+        self.assertEqual(client.purge(['a', 'b', 'c']), 2)
+        self.assertEqual(StubProxy.purged, [['a', 'b'], ['c']])
+        broken = PurgeClient(url="http://127.0.0.1:9/purge", timeout=0.5)
+        with self.assertLogs('posts.edge', 'ERROR'):
+            self.assertEqual(broken.purge(['a']), 0)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'page-cache-test'}})
+class PageCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        self.post = Post.objects.create(text="пост", author=self.sarah,
+                                        group=self.cats)
+        self.url = reverse('group', args=['cats'])
+
+    # Повторный запрос не рисует страницу и не ходит за постами
+    def test_anonymous_hit(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'пост')
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, '<!--hole')
+        self.assertFalse(any('posts_post' in q['sql'] for q in queries))
+
+        Post.objects.create(text="новый", author=self.james,
+                            group=self.cats)
+        self.assertContains(self.client.get(self.url), 'новый')
+
+    # Каждая страница ленты своя, новый пост виден сразу
+    def test_index_pages(self):
+        for i in range(10):
+            Post.objects.create(text=f"старый {i}", author=self.sarah)
+        first = self.client.get(reverse('index'))
+        second = self.client.get(reverse('index') + '?page=2')
+        self.assertContains(first, 'старый 9')
+        self.assertNotContains(second, 'старый 9')
+        self.assertContains(second, 'пост')
+
+        Post.objects.create(text="свежий", author=self.james)
+        self.assertContains(self.client.get(reverse('index')), 'свежий')
+
+    # Страница, во время рисования которой данные поменялись, не хранится
+    def test_changed_while_rendering(self):
+        def view(request, change):
+            if change:
+                edge.bump_versions(['changing'])
+            return edge.edge_cache(request, HttpResponse('page'),
+                                   ['changing'])
+
+        request = RequestFactory().get('/changing/')
+        request.user = AnonymousUser()
+        key = page_cache_key(request)
+        shared_page_cache(view)(request, True)
+        self.assertIsNone(cache.get(key))
+        shared_page_cache(view)(request, False)
+        self.assertIsNotNone(cache.get(key))
+
+    # Общая страница одна, личные куски у каждого свои
+    def test_holes_filled_per_user(self):
+        sarah, james = Client(), Client()
+        sarah.force_login(self.sarah)
+        james.force_login(self.james)
+        edit_url = reverse('post_edit', args=['sarah', self.post.pk])
+
+        response = sarah.get(self.url)
+        self.assertContains(response, 'Пользователь: sarah')
+        self.assertContains(response, edit_url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = james.get(self.url)
+        self.assertFalse(any('posts_post' in q['sql'] for q in queries))
+        self.assertContains(response, 'Пользователь: james')
+        self.assertNotContains(response, edit_url)
+        self.assertNotContains(response, 'sarah.')
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Войти')
+        response = james.get(reverse('index'))
+        self.assertContains(response, 'Избранные авторы')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'feed-test'}}, FEED_SIZE=2)
+class FeedTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.cats = Group.objects.create(title="Коты", slug="cats")
+        for text in ("первый", "второй", "третий"):
+            Post.objects.create(text=text, author=self.sarah,
+                                group=self.cats)
+
+    # В ленте последние FEED_SIZE записей, повтор берётся из кэша
+    def test_feeds(self):
+        for url in (reverse('feed_rss'), reverse('feed_atom'),
+                    reverse('author_rss', args=['sarah']),
+                    reverse('group_atom', args=['cats'])):
+            response = self.client.get(url)
+            self.assertContains(response, 'третий')
+            self.assertNotContains(response, 'первый')
+        self.assertEqual(response['Surrogate-Key'],
+                         f'group-{self.cats.pk}')
+
+        url = reverse('author_rss', args=['sarah'])
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        Post.objects.create(text="четвёртый", author=self.sarah)
+        self.assertContains(self.client.get(url), 'четвёртый')
+        self.assertEqual(
+            self.client.get(reverse('author_atom', args=['nobody']))
+            .status_code, 404)
+
+
+@override_settings(CACHES=settings.TEST_CACHES, SITEMAP_SHARD_SIZE=2)
+class SitemapTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(SITEMAP_ROOT=self.root.name)
+        self.settings.enable()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.posts = [Post.objects.create(text=str(i), author=self.sarah)
+                      for i in range(3)]
+
+    def tearDown(self):
+        self.settings.disable()
+        self.root.cleanup()
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            return None
+        return b''.join(response.streaming_content).decode()
+
+    # Пересобираются только куски, где что-то поменялось
+    def test_incremental_build(self):
+        call_command('build_sitemap', '--full', stdout=io.StringIO())
+        index = self.fetch('/sitemap.xml')
+        for post in self.posts:
+            shard = f'sitemap-{post.pk // 2}.xml'
+            self.assertIn(f'/{shard}</loc>', index)
+            self.assertIn(reverse('post', args=['sarah', post.pk]),
+                          self.fetch(f'/{shard}'))
+
+        self.assertEqual(build_sitemap(), 0)
+        post_id = self.posts[-1].pk
+        self.posts[-1].delete()
+        self.assertEqual(build_sitemap(), 1)
+        shard = self.fetch(f'/sitemap-{post_id // 2}.xml') or ''
+        self.assertNotIn(reverse('post', args=['sarah', post_id]), shard)
+
+
+@override_settings(CACHES=settings.TEST_CACHES)
+class FollowTest(TransactionTestCase):
+
+    def setUp(self):
+        self.sarah = User.objects.create_user(username="sarah")
+        self.james = User.objects.create_user(username="james")
+
+    def follow_queries(self, queries):
+        return [q['sql'] for q in queries if 'posts_follow' in q['sql']]
+
+    # К таблице подписок - один запрос и на подписку, и на отписку
+    def test_follow_is_idempotent(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(follows.follow(self.james, self.sarah))
+        self.assertEqual(len(self.follow_queries(queries)), 1)
+        self.assertFalse(follows.follow(self.james, self.sarah))
+        self.assertEqual(Follow.objects.count(), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(follows.unfollow(self.james, self.sarah))
+        self.assertEqual(len(self.follow_queries(queries)), 1)
+        self.assertFalse(follows.unfollow(self.james, self.sarah))
+        self.assertFalse(Follow.objects.exists())
+
+    # Удаление мимо unfollow() тоже сообщает об отписке
+    def test_other_deletes_send_follow_changed(self):
+        unfollowed = []
+
+        def listener(sender, instance, created, **kwargs):
+            if not created:
+                unfollowed.append((instance.user_id, instance.author_id))
+
+        follows.follow_changed.connect(listener)
+        self.addCleanup(follows.follow_changed.disconnect, listener)
+        follows.follow(self.james, self.sarah)
+        follows.delete_follows(Follow.objects.all())
+        self.assertEqual(unfollowed, [(self.james.pk, self.sarah.pk)])
+
+        follows.follow(self.sarah, self.james)
+        james_id = self.james.pk
+        self.james.delete()
+        self.assertEqual(unfollowed[1:], [(self.sarah.pk, james_id)])
+        self.assertFalse(Follow.objects.exists())
+
+    # Параллельные клики оставляют одну подписку, и ровно один из них
+    # считается новым
+    def test_concurrent_clicks(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def click():
+            barrier.wait()
+            try:
+                results.append(follows.follow(self.james, self.sarah))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_unfollow_view_without_follow(self):
+        self.client.force_login(self.james)
+        url = reverse('profile_unfollow', args=['sarah'])
+        self.assertRedirects(self.client.get(url),
+                             reverse('profile', args=['sarah']))
+
+
+SHARDS = ['shard0', 'shard1', 'shard2']
+
+
+@override_settings(CACHES=settings.TEST_CACHES, POST_SHARDS=SHARDS,
+                   SHARD_CACHE_TIMEOUT=0)
+class ShardTest(TransactionTestCase):
+    """Три шарда - три временных файла SQLite рядом с тестовой default."""
+    databases = {'default', *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.shard_dir.name, f'{alias}.sqlite3'),
+            }
+            connections.ensure_defaults(alias)
+            connections.prepare_test_settings(alias)
+            call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections.databases[alias]
+            delattr(connections._connections, alias)
+        cls.shard_dir.cleanup()
+
+    def setUp(self):
+        # user.pk % 3: каждому автору свой шард
+        self.authors = [User.objects.create_user(username=f'author{i}')
+                        for i in range(3)]
+        self.reader = User.objects.create_user(username='reader')
+        self.cats = Group.objects.create(title='Коты', slug='cats')
+        self.posts = [Post.objects.create(text=f'пост {author.username}',
+                                          author=author, group=self.cats)
+                      for author in self.authors * 2]
+
+    def shard_of(self, post):
+        return [alias for alias in SHARDS
+                if Post.objects.using(alias).filter(pk=post.pk).exists()]
+
+    def test_posts_live_on_author_shard(self):
+        for post in self.posts:
+            self.assertEqual(self.shard_of(post),
+                             [SHARDS[post.author_id % 3]])
+        self.assertEqual(len({post.pk for post in self.posts}), 6)
+        self.assertFalse(Post.objects.using('default').exists())
+
+        self.client.force_login(self.reader)
+        author = self.authors[1]
+        post = self.posts[1]
+        self.client.post(reverse('add_comment', args=[author.username,
+                                                      post.pk]),
+                         {'text': 'коммент'})
+        self.assertTrue(Comment.objects.using(SHARDS[author.pk % 3])
+                        .filter(post=post, author=self.reader).exists())
+        response = self.client.get(reverse('post', args=[author.username,
+                                                         post.pk]))
+        self.assertContains(response, 'коммент')
+        response = self.client.get(reverse('profile',
+                                           args=[author.username]))
+        self.assertEqual(response.context['paginator'].count, 2)
+
+    # Ленты сливают шарды по убыванию даты
+    def test_fan_in(self):
+        expected = [post.pk for post in reversed(self.posts)]
+        response = self.client.get(reverse('index'))
+        self.assertEqual([post.pk for post in response.context['page']],
+                         expected)
+        response = self.client.get(reverse('group', args=['cats']) + '?page=2')
+        self.assertEqual([post.pk for post in response.context['page']],
+                         expected[3:])
+
+        for author in self.authors[:2]:
+            follows.follow(self.reader, author)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page']],
+            [post.pk for post in reversed(self.posts)
+             if post.author in self.authors[:2]])
+
+    # Без одного шарда его авторы переезжают, id и лента не меняются
+    def test_reshard(self):
+        moved = [author for author in self.authors
+                 if SHARDS[author.pk % 3] == 'shard2']
+        with self.settings(POST_SHARDS=SHARDS[:2]):
+            call_command('reshard', stdout=io.StringIO())
+            self.assertFalse(Post.objects.using('shard2').exists())
+            for post in self.posts:
+                self.assertEqual(self.shard_of(post),
+                                 [SHARDS[post.author_id % 2]])
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['paginator'].count, 6)
+            author = moved[0]
+            response = self.client.get(reverse('profile',
+                                               args=[author.username]))
+            self.assertEqual(response.context['paginator'].count, 2)
+
+    # Записанное по старой карте между шагами переноса не теряется
+    def test_move_catches_up(self):
+        author = self.authors[0]
+        source = SHARDS[author.pk % 3]
+        target = next(alias for alias in SHARDS if alias != source)
+        self.assertEqual(shards.move_author(author.pk, target), source)
+        late = Post.objects.using(source).create(text='поздний',
+                                                 author=author)
+        Comment.objects.using(source).create(post=late, author=self.reader,
+                                             text='коммент')
+        self.assertEqual(shards.finish_move(author.pk, source), 3)
+        self.assertFalse(Post.objects.using(source)
+                         .filter(author=author).exists())
+        self.assertEqual(self.shard_of(late), [target])
+        self.assertTrue(Comment.objects.using(target)
+                        .filter(post_id=late.pk).exists())
+
+    # Уведомления в default ссылаются на посты с шардов
+    def test_notifications(self):
+        follows.follow(self.reader, self.authors[1])
+        self.client.force_login(self.authors[1])
+        self.client.post(reverse('new_post'), {'text': 'для подписчиков'})
+        run_pending()
+        self.assertFalse(Job.objects.filter(status=Job.FAILED).exists())
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('notifications'))
+        self.assertEqual(len(response.context['page'].object_list), 1)
+        self.assertContains(response, '@author1')
+
+
+    # «Популярное», экспорт и дайджест видят посты на всех шардах
+    @override_settings(POPULAR_FEED_SIZE=4)
+    def test_features_read_every_shard(self):
+        response = self.client.get(reverse('popular'))
+        self.assertEqual(response.context['paginator'].count, 4)
+        self.assertEqual([post.pk for post in response.context['page']],
+                         [post.pk for post in reversed(self.posts)][:4])
+
+        author = self.authors[2]
+        Comment.objects.create(post=self.posts[0], author=author,
+                               text='чужому посту')
+        posts = [row for batch in export.post_rows(author) for row in batch]
+        self.assertEqual(len(posts), 2)
+        comments = [row for batch in export.comment_rows(author)
+                    for row in batch]
+        self.assertEqual([row['text'] for row in comments], ['чужому посту'])
+
+        for followed in self.authors[:2]:
+            follows.follow(self.reader, followed)
+        since = timezone.now() - timedelta(days=1)
+        [message] = digest.build_digests(
+            [{'pk': self.reader.pk, 'username': 'reader',
+              'email': 'reader@example.com'}], since, 'example.com')
+        self.assertEqual(message.body.count('пост author'), 4)
+
+    # Архив забирает посты со всех шардов, счётчики сообществ не меняются
+    def test_archive(self):
+        call_command('archive_posts', days=0, stdout=io.StringIO())
+        for alias in shards.all_aliases():
+            self.assertFalse(Post.objects.using(alias).exists())
+        self.assertEqual(ArchivedPost.objects.count(), 6)
+        self.assertEqual(GroupStats.objects.get(group=self.cats).post_count,
+                         6)
+
+    # Удаление аккаунта находит посты автора на его шарде
+    def test_purge_user(self):
+        author = self.authors[1]
+        alias = SHARDS[author.pk % 3]
+        Comment.objects.create(post=self.posts[1], author=self.reader,
+                               text='коммент')
+        purge.delete_account(author)
+        job = Job.objects.get(kind='purge_user')
+        run_pending()
+        job.refresh_from_db()
+        # комментарий, два поста, GroupAuthorStats и сам пользователь
+        self.assertEqual(job.total, 5)
+        self.assertFalse(Post.objects.using(alias).filter(
+            author_id=author.pk).exists())
+        self.assertFalse(Comment.objects.using(alias).exists())
+        self.assertFalse(User.objects.filter(pk=author.pk).exists())
+        self.assertEqual(GroupStats.objects.get(group=self.cats).post_count,
+                         4)
+
+@override_settings(CACHES=settings.TEST_CACHES, VIEW_FLUSH_EVERY=3,
+                   VIEW_FLUSH_INTERVAL=10 ** 6)
+class ViewCounterTest(TestCase):
+
+    def setUp(self):
+        counters.views.take()
+        self.sarah = User.objects.create_user(username="sarah")
+        self.posts = [Post.objects.create(text=str(i), author=self.sarah)
+                      for i in range(2)]
+
+    def views(self):
+        return [post.views for post in
+                Post.objects.order_by('pk')]
+
+    def seen(self, post):
+        return self.client.post(reverse('post_seen', args=['sarah',
+                                                           post.pk]))
+
+    # Просмотры копятся в памяти и уходят одним UPDATE
+    def test_buffered_flush(self):
+        first, second = self.posts
+        self.seen(first)
+        self.seen(second)
+        self.assertEqual(self.views(), [0, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.seen(first)
+        self.assertEqual(response.status_code, 204)
+        self.assertIn('no-cache', response['Cache-Control'])
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE', updates[0])
+        self.assertEqual(self.views(), [2, 1])
+        self.assertContains(self.client.get(reverse('index')),
+                            '2 просмотров')
+
+        counters.record_view(second.pk)
+        self.assertEqual(counters.views.flush(), 1)
+        self.assertEqual(self.views(), [2, 2])
+
+    # Страница поста сама не считает (её кэширует прокси), а зовёт маячок
+    def test_page_sends_beacon(self):
+        response = self.client.get(reverse('post', args=['sarah',
+                                                         self.posts[0].pk]))
+        self.assertContains(response, reverse('post_seen', args=[
+            'sarah', self.posts[0].pk]))
+        self.assertEqual(counters.views.take(), {})
+
+    # Правка поста не затирает накопленные просмотры
+    def test_edit_keeps_views(self):
+        post = self.posts[0]
+        Post.objects.filter(pk=post.pk).update(views=7)
+        self.client.force_login(self.sarah)
+        self.client.post(reverse('post_edit', args=['sarah', post.pk]),
+                         {'text': 'правка'})
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.views), ('правка', 7))
+
+
+@override_settings(CACHES=settings.TEST_CACHES, IMAGE_MAX_BYTES=2000,
+                   IMAGE_MAX_WIDTH=100, IMAGE_MAX_HEIGHT=100,
+                   IMAGE_MAX_PIXELS=5000)
+class UploadTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.client.force_login(self.user)
+
+    def image(self, size, name='test.png', format='PNG', noise=False):
+        from PIL import Image
+        img = Image.new('RGB', size, color=(73, 109, 137))
+        if noise:
+            img.frombytes(os.urandom(size[0] * size[1] * 3))
+        file = io.BytesIO()
+        img.save(file, format)
+        file.seek(0)
+        file.name = name
+        return file
+
+    def post(self, image):
+        return self.client.post(reverse('new_post'),
+                                {'text': 'with image', 'image': image})
+
+    # Слишком тяжёлые и слишком большие картинки отвергаются по заголовку
+    def test_rejected(self):
+        cases = {
+            'bytes': self.image((40, 40), noise=True),
+            'width': self.image((120, 10)),
+            'pixels': self.image((80, 80)),
+            'format': self.image((10, 10), 'test.bmp', 'BMP'),
+        }
+        for case, image in cases.items():
+            with self.subTest(case=case):
+                errors = self.post(image).context['form'].errors['image']
+                self.assertIn('Загрузите правильное изображение. Файл, '
+                              'который вы загрузили, поврежден или не '
+                              'является изображением.', errors)
+                self.assertEqual(len(errors), 2)
+        self.assertFalse(Post.objects.exists())
+
+    # Принятая картинка проверяется целиком в фоне, битая убирается
+    def test_verified_later(self):
+        response = self.post(self.image((60, 30)))
+        self.assertRedirects(response, reverse('index'))
+        post = Post.objects.get()
+        self.assertTrue(post.image)
+        self.assertFalse(post.image_checked)
+        self.assertTrue(Job.objects.filter(kind='verify_image').exists())
+        # до проверки в ленте заглушка, картинку запрос не декодирует
+        with mock.patch('sorl.thumbnail.base.ThumbnailBackend'
+                        '.get_thumbnail') as get_thumbnail:
+            self.assertNotContains(self.client.get(reverse('index')),
+                                   '<img class="card-img"')
+            get_thumbnail.assert_not_called()
+            run_pending()
+            get_thumbnail.assert_called_once()
+        post.refresh_from_db()
+        self.assertTrue(post.image)
+        self.assertTrue(post.image_checked)
+
+        self.post(self.image((60, 30)))
+        post = Post.objects.latest('pk')
+        path = post.image.path
+        with open(path, 'r+b') as file:
+            file.truncate(os.path.getsize(path) // 2)
+        run_pending()
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertFalse(os.path.exists(path))
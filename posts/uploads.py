@@ -0,0 +1,134 @@
+import logging
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import DEFAULT_DB_ALIAS
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from .jobs import enqueue, handler
+from .models import Post
+from .purge import delete_images
+
+logger = logging.getLogger(__name__)
+
+# миниатюра для ленты, как в templates/includes/post_item.html
+THUMBNAIL = ("960x339", {"crop": "center", "upscale": True})
+
+
+# почему загрузка отвергнута: текст к стандартной ошибке ImageField
+REJECTED = {
+    "too_large": "Картинка слишком большая: не больше %(bytes)s "
+                 "и %(width)s×%(height)s точек.",
+    "format": "Поддерживаются только %(formats)s.",
+}
+
+
+def rejection_message(reason):
+    return REJECTED[reason] % {
+        "bytes": filesizeformat(settings.IMAGE_MAX_BYTES),
+        "width": settings.IMAGE_MAX_WIDTH,
+        "height": settings.IMAGE_MAX_HEIGHT,
+        "formats": ", ".join(settings.IMAGE_FORMATS),
+    }
+
+
+def header_problem(path):
+    """Что не так с картинкой по одному заголовку; None - всё в порядке.
+
+    Image.open читает только формат и размеры, пиксели не распаковываются.
+    Не картинку пропускаем: её отвергнет сам ImageField.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(path)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        return "too_large"
+    except Exception:
+        return None
+    with image:
+        width, height = image.size
+        if (width > settings.IMAGE_MAX_WIDTH or
+                height > settings.IMAGE_MAX_HEIGHT or
+                width * height > settings.IMAGE_MAX_PIXELS):
+            return "too_large"
+        if image.format not in settings.IMAGE_FORMATS:
+            return "format"
+    return None
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, но не больше IMAGE_MAX_BYTES.
+
+    Остаток тела запроса дочитывается и выбрасывается, так что ни диск,
+    ни память воркера не растут от размера загрузки. Когда файл принят,
+    смотрим заголовок (header_problem); если файл слишком велик или не
+    проходит по размерам, он обнуляется и помечается rejected -
+    forms.ImageField откажет со своей обычной ошибкой, не декодируя его.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received <= settings.IMAGE_MAX_BYTES:
+            self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file_size > settings.IMAGE_MAX_BYTES:
+            file.rejected = "too_large"
+        else:
+            file.rejected = header_problem(file.temporary_file_path())
+        if file.rejected:
+            file.truncate(0)
+        return file
+
+
+def verify_later(post):
+    """Ставит в очередь полную проверку только что загруженной картинки."""
+    if post.image:
+        enqueue("verify_image", total=1, post_id=post.pk,
+                name=post.image.name, db=post._state.db)
+
+
+@handler("verify_image")
+def verify_image(job, payload, batch_size):
+    """Декодирует картинку целиком; битую убирает из поста и с диска.
+
+    Целую тут же режет на миниатюру и отмечает image_checked: до этого
+    лента показывает заглушку и не декодирует загрузку в запросе.
+    """
+    if job.cursor:
+        return 0
+    job.cursor = 1
+    post = (Post.objects.using(payload.get("db") or DEFAULT_DB_ALIAS)
+            .filter(pk=payload["post_id"]).first())
+    if post is None or post.image.name != payload["name"]:
+        # пост удалили или картинку уже заменили
+        return 1
+    try:
+        with post.image.open("rb") as file, Image.open(file) as image:
+            image.load()
+    except Exception:
+        logger.warning("Картинка %s поста %s не декодируется, убираем",
+                       payload["name"], post.pk, exc_info=True)
+        post.image = None
+        post.save(update_fields=["image"])
+        delete_images([payload["name"]])
+        return 1
+    geometry, options = THUMBNAIL
+    try:
+        get_thumbnail(post.image, geometry, **options)
+    except Exception:
+        # картинка цела; миниатюру тогда нарежет шаблон
+        logger.warning("Не вышло нарезать миниатюру %s", payload["name"],
+                       exc_info=True)
+    post.image_checked = True
+    post.save(update_fields=["image_checked"])
+    return 1
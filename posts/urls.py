@@ -1,14 +1,31 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("rss/", feeds.site_rss, name="feed_rss"),
+    path("atom/", feeds.site_atom, name="feed_atom"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("popular/", views.popular, name="popular"),
+    path("group/", views.group_index, name="group_index"),
     path("group/<slug:slug>/", views.group_posts, name="group"),
+    path("group/<slug:slug>/rss/", feeds.group_rss, name="group_rss"),
+    path("group/<slug:slug>/atom/", feeds.group_atom, name="group_atom"),
     path("new/", views.new_post, name="new_post"),
+    path("notifications/", views.notifications, name="notifications"),
+    path("notifications/unread/", views.notifications_unread,
+         name="notifications_unread"),
     path('<str:username>/', views.profile, name='profile'),
+    path('<str:username>/rss/', feeds.author_rss, name='author_rss'),
+    path('<str:username>/atom/', feeds.author_atom, name='author_atom'),
+    path('<str:username>/export/', views.profile_export,
+         name='profile_export'),
+    path('<str:username>/delete/', views.profile_delete,
+         name='profile_delete'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path('<str:username>/<int:post_id>/seen/', views.post_seen,
+         name='post_seen'),
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit, name='post_edit'),
     path("<str:username>/<int:post_id>/comment/", views.add_comment,
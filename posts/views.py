@@ -1,35 +1,80 @@
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, logout
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, render
 from django.shortcuts import redirect
+from django.utils.cache import add_never_cache_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from . import follows
+from .archive import ChainedPostList, get_post_or_archived
+from .counters import record_view
+from .edge import edge_cache, post_keys
+from .export import archive_chunks
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .jobs import enqueue
+from .models import Follow, Group, GroupStats, Post
+from .notifications import attach_posts, mark_read, unread_count
+from .pagecache import shared_page_cache
+from .purge import delete_account
+from .queries import with_comment_count
+from .ranking import popular_posts
+from .shards import author_posts, fan_in, is_sharded
+from .uploads import verify_later
 
 User = get_user_model()
 
 
+@shared_page_cache
 def index(request):
-    post_list = Post.objects.select_related('author').all()
+    post_list = fan_in(with_comment_count(
+        Post.objects.select_related('author', 'group')
+        .filter(author__is_active=True)))
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
-    return render(
+    response = render(
         request,
         'index.html',
         {'page': page, 'paginator': paginator}
     )
+    return edge_cache(request, response, ['index', *post_keys(page)])
+
+
+def popular(request):
+    paginator = Paginator(popular_posts(), 10)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'popular.html',
+                  {'page': page, 'paginator': paginator})
+
 
+def group_identity(request, slug):
+    return Group.objects.filter(slug=slug).values_list('pk', flat=True).first()
 
+
+@shared_page_cache(identity=group_identity)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    paginator = Paginator(group.group.all(), 3)
+    post_list = fan_in(with_comment_count(
+        group.group.select_related('author', 'group')
+        .filter(author__is_active=True)))
+    paginator = Paginator(post_list, 3)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
-    return render(request,
-                  "group.html",
-                  {"group": group, 'page': page, 'paginator': paginator, })
+    response = render(request,
+                      "group.html",
+                      {"group": group, 'page': page, 'paginator': paginator})
+    return edge_cache(request, response,
+                      [f'group-{group.pk}', *post_keys(page)])
+
+
+def group_index(request):
+    groups = (GroupStats.objects.select_related('group')
+              .order_by('-last_post_date'))
+    return render(request, 'groups.html', {'groups': groups})
 
 
 @login_required
@@ -37,51 +82,108 @@ def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         form.instance.author = request.user
-        form.save()
+        post = form.save()
+        verify_later(post)
+        # сколько подписчиков, задача посчитает сама
+        enqueue('notify_followers', post_id=post.pk,
+                author_id=request.user.pk)
         return redirect('index')
     return render(request, 'new_post.html', {'form': form})
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User, username=username, is_active=True)
     user = request.user
-    paginator = Paginator(author.posts.all(), 10)
+    post_list = ChainedPostList(
+        with_comment_count(author.posts.select_related('author', 'group')),
+        with_comment_count(
+            author.archived_posts.select_related('author', 'group')))
+    paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
 
     following = Follow.objects.filter(user__username=user,
                                       author=author).count()
 
-    return render(request, 'profile.html',
-                  context={'page': page,
-                           'paginator': paginator,
-                           'author': author,
-                           'user': user,
-                           'following': following
-                           })
+    response = render(request, 'profile.html',
+                      context={'page': page,
+                               'paginator': paginator,
+                               'author': author,
+                               'user': user,
+                               'following': following
+                               })
+    return edge_cache(request, response,
+                      [f'author-{author.pk}', *post_keys(page)])
+
+
+@login_required
+def profile_export(request, username):
+    if request.user.username != username:
+        raise Http404
+    response = StreamingHttpResponse(archive_chunks(request.user),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="yatube-{username}.zip"')
+    return response
+
+
+@login_required
+def profile_delete(request, username):
+    if request.user.username != username:
+        raise Http404
+    if request.method == 'POST':
+        delete_account(request.user)
+        logout(request)
+        return redirect('index')
+    return render(request, 'profile_delete.html')
 
 
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    # имя автора сверяется тем же запросом, что достаёт пост
+    post = get_post_or_archived(
+        with_comment_count(
+            author_posts(username).select_related('author', 'group')),
+        pk=post_id, author__username=username, author__is_active=True)
+    comments = post.comments.filter(
+        author__is_active=True).select_related('author')
 
     form = CommentForm()
 
-    return render(request, 'post.html', {'author': post.author,
-                                         'post': post,
-                                         'form': form,
-                                         })
+    response = render(request, 'post.html', {'author': post.author,
+                                             'post': post,
+                                             'comments': comments,
+                                             'form': form,
+                                             })
+    return edge_cache(request, response,
+                      [f'post-{post.pk}', f'author-{post.author_id}'])
+
+
+@csrf_exempt
+@require_POST
+def post_seen(request, username, post_id):
+    """Маячок со страницы поста (navigator.sendBeacon).
+
+    Просмотр считается здесь: страницу поста анониму отдаёт прокси,
+    и до post_view такие запросы не доходят.
+    """
+    record_view(post_id)
+    response = HttpResponse(status=204)
+    add_never_cache_headers(response)
+    return response
 
 
 @login_required
 def post_edit(request, username, post_id):
     is_form_edit = True
-    post = get_object_or_404(Post, author__username=username,
-                             pk__iexact=post_id)
+    post = get_object_or_404(author_posts(username),
+                             author__username=username, pk__iexact=post_id)
     if post.author == request.user:
         form = PostForm(request.POST or None,
                         files=request.FILES or None, instance=post)
         if form.is_valid():
             post = form.save()
+            if 'image' in form.changed_data:
+                verify_later(post)
             return redirect('post', username, post_id)
         form = PostForm(instance=post)
 
@@ -108,8 +210,9 @@ def server_error(request):
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post,
+    post = get_object_or_404(author_posts(username),
                              author__username=username,
+                             author__is_active=True,
                              pk__iexact=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
@@ -123,7 +226,16 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    if is_sharded():
+        # подписки лежат в default, на шардах их не к чему присоединить
+        following = list(request.user.follower.values_list('author_id',
+                                                           flat=True))
+        post_list = Post.objects.filter(author_id__in=following)
+    else:
+        post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = fan_in(with_comment_count(
+        post_list.select_related('author', 'group')
+        .filter(author__is_active=True)))
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
@@ -136,17 +248,40 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User, username=username, is_active=True)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        follows.follow(request.user, author)
     return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    profile_follow = Follow.objects.get(author=author,
-                                        user=request.user)
-    if Follow.objects.filter(pk=profile_follow.pk).exists():
-        profile_follow.delete()
+    follows.unfollow(request.user, author)
     return redirect('profile', username=username)
+
+
+@login_required
+def notifications(request):
+    if is_sharded():
+        # посты не в default, JOIN к ним не сделать
+        notification_list = request.user.notifications.all()
+    else:
+        notification_list = (request.user.notifications
+                             .filter(post__author__is_active=True)
+                             .select_related('post__author', 'post__group'))
+    paginator = Paginator(notification_list, 20)
+    page = paginator.get_page(request.GET.get('page'))
+    shown = [notification.pk for notification in page]
+    if is_sharded():
+        page.object_list = attach_posts(page.object_list)
+    response = render(request, 'notifications.html',
+                      {'page': page, 'paginator': paginator})
+    # страница показана - всё на ней уже прочитано
+    mark_read(request.user, shown)
+    return response
+
+
+@login_required
+def notifications_unread(request):
+    return JsonResponse({'unread': unread_count(request.user)})
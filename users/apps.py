@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
-    name = 'Users'
+    name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa
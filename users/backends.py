@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{settings.USER_CACHE_VERSION}:{user_id}"
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который держит request.user в кэше по id и версии."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # ModelBackend стоит в списке после нас только ради старых сессий
+        # (get_user); неудачный вход обрываем здесь, иначе он второй раз
+        # прогнал бы хешер пароля
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -1,10 +1,44 @@
-from django.contrib.auth.forms import UserCreationForm
+import re
+from functools import lru_cache
+
+from django import forms
 from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import UserCreationForm
+from django.urls import URLPattern, get_resolver
 
 User = get_user_model()
 
+SEGMENT_RE = re.compile(r"^\^?([\w.-]+)/")
+
+
+def first_segments(patterns):
+    for pattern in patterns:
+        match = SEGMENT_RE.match(str(pattern.pattern))
+        if match:
+            yield match.group(1).lower()
+        elif not isinstance(pattern, URLPattern) and \
+                not str(pattern.pattern):
+            # include("posts.urls") без префикса
+            yield from first_segments(pattern.url_patterns)
+
+
+@lru_cache(maxsize=None)
+def reserved_usernames():
+    """Первые части адресов сайта (rss, popular, notifications, ...).
+
+    Профиль /<имя>/ стоит в urls последним, и пользователя с таким
+    именем эти адреса закрыли бы.
+    """
+    return frozenset(first_segments(get_resolver().url_patterns))
+
 
 class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username.lower() in reserved_usernames():
+            raise forms.ValidationError("Это имя занято адресом сайта.")
+        return username
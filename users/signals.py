@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .backends import invalidate_user
+from .usernames import publish
+
+User = get_user_model()
+
+UNCHANGED = object()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # смена пароля, last_login при входе и правки в админке проходят
+    # через save(), так что закэшированный объект сбрасываем здесь
+    invalidate_user(instance.pk)
+
+
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def user_session_changed(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.pk)
+
+
+@receiver(pre_save, sender=User)
+def remember_indexed_name(sender, instance, using, update_fields=None,
+                          raw=False, **kwargs):
+    # имя, под которым пользователь сейчас в индексе (None - его там нет);
+    # last_login и прочие правки по update_fields индекс не трогают
+    instance._indexed_name = UNCHANGED
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and \
+            not {"username", "is_active"} & set(update_fields):
+        return
+    old = (User._base_manager.using(using).filter(pk=instance.pk)
+           .values_list("username", "is_active").first())
+    instance._indexed_name = old[0] if old and old[1] else None
+
+
+@receiver(post_save, sender=User)
+def username_added(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was = None if created else getattr(instance, "_indexed_name", UNCHANGED)
+    if was is UNCHANGED:
+        return
+    now = instance.username if instance.is_active else None
+    if was == now:
+        return
+    events = ([("remove", was)] if was else []) + \
+        ([("add", now)] if now else [])
+    transaction.on_commit(
+        lambda: [publish(op, username) for op, username in events])
+
+
+@receiver(post_delete, sender=User)
+def username_removed(sender, instance, **kwargs):
+    username = instance.username
+    transaction.on_commit(lambda: publish("remove", username))
@@ -0,0 +1,181 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import Client, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .backends import user_cache_key
+from .usernames import index
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'users-test',
+    },
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedUserTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="sarah",
+                                             password="Secret-pass-42")
+        self.client = Client()
+        self.client.login(username="sarah", password="Secret-pass-42")
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [q['sql'] for q in queries
+                if 'django_session' in q['sql'] or
+                'FROM "auth_user"' in q['sql']]
+
+    # Повторный запрос не ходит в БД ни за сессией, ни за пользователем
+    def test_session_and_user_are_cached(self):
+        url = reverse('password_change')
+        self.client.get(url)
+        self.assertEqual(self.auth_queries(url), [])
+
+    # Смена пароля сбрасывает закэшированного пользователя
+    def test_password_change_invalidates_user(self):
+        self.client.get(reverse('password_change'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+
+        self.client.post(reverse('password_change'),
+                         {'old_password': 'Secret-pass-42',
+                          'new_password1': 'Other-pass-42',
+                          'new_password2': 'Other-pass-42'})
+        cached = cache.get(user_cache_key(self.user.pk))
+        self.assertTrue(cached is None or
+                        cached.check_password('Other-pass-42'))
+
+        response = self.client.get(reverse('password_change'))
+        self.assertEqual(response.status_code, 200)
+
+    # После выхода закэшированный пользователь не используется
+    def test_logout_invalidates_user(self):
+        self.client.get(reverse('password_change'))
+        self.client.get(reverse('logout'))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+        response = self.client.get(reverse('password_change'))
+        self.assertEqual(response.status_code, 302)
+
+    # Новый вход идёт через кэш, сессии со старым бэкендом не теряются
+    def test_old_sessions_stay_logged_in(self):
+        self.assertEqual(self.client.session['_auth_user_backend'],
+                         'users.backends.CachedModelBackend')
+        client = Client()
+        client.force_login(self.user,
+                           'django.contrib.auth.backends.ModelBackend')
+        response = client.get(reverse('password_change'))
+        self.assertEqual(response.status_code, 200)
+
+    # Неудачный вход проверяет пароль один раз, а не в каждом бэкенде
+    def test_failed_login_hashes_once(self):
+        with mock.patch('django.contrib.auth.backends.ModelBackend'
+                        '.authenticate', autospec=True,
+                        return_value=None) as authenticate:
+            for username in ('sarah', 'nobody'):
+                self.assertFalse(Client().login(username=username,
+                                                password='wrong'))
+        self.assertEqual(authenticate.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UsernameIndexTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        index.seq = None
+        for name in ("sarah", "Sam", "samuel", "james"):
+            User.objects.create_user(username=name)
+        self.url = reverse('username_suggestions')
+
+    def suggest(self, prefix):
+        return self.client.get(self.url, {'q': prefix}).json()['usernames']
+
+    # Подсказки по префиксу без регистра, повторный запрос - без БД
+    def test_prefix_search(self):
+        self.assertEqual(self.suggest('@sa'), ['Sam', 'samuel', 'sarah'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('SAM'), ['Sam', 'samuel'])
+        with self.settings(USERNAME_SUGGESTIONS=1):
+            self.assertEqual(self.suggest('s'), ['Sam'])
+        self.assertEqual(self.suggest(''), [])
+
+    # Регистрация и удаление меняют индекс событием, без перечитывания
+    def test_index_follows_signups(self):
+        self.suggest('sa')
+        self.client.post(reverse('signup'), {
+            'username': 'sandra', 'password1': 'Secret-pass-42',
+            'password2': 'Secret-pass-42'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('sa'),
+                             ['Sam', 'samuel', 'sandra', 'sarah'])
+
+        sarah = User.objects.get(username='sarah')
+        sarah.is_active = False
+        sarah.save(update_fields=['is_active'])
+        User.objects.get(username='Sam').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('sa'), ['samuel', 'sandra'])
+
+    # Полное сохранение (как в админке) и смена имени тоже доходят до индекса,
+    # а вход пользователя (last_login) событий не порождает
+    def test_full_save_updates_index(self):
+        self.suggest('sa')
+        sarah = User.objects.get(username='sarah')
+        sarah.is_active = False
+        sarah.save()
+        samuel = User.objects.get(username='samuel')
+        samuel.username = 'salome'
+        samuel.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('sa'), ['salome', 'Sam'])
+        seq = cache.get('usernames:seq')
+        User.objects.get(username='Sam').save(update_fields=['last_login'])
+        self.assertEqual(cache.get('usernames:seq'), seq)
+
+    # Поток, дождавшийся замка после чужой перестройки, её не повторяет
+    def test_rebuild_once_after_ttl(self):
+        self.suggest('sa')
+        index.loaded_at -= 10 ** 6
+        index.lock.acquire()
+        waiting = threading.Thread(target=index.refresh)
+        waiting.start()
+        index.rebuild(cache.get('usernames:seq') or 0)
+        loaded_at = index.loaded_at
+        index.lock.release()
+        waiting.join()
+        self.assertEqual(index.loaded_at, loaded_at)
+
+    def test_search_redirects_to_profile(self):
+        url = reverse('user_search')
+        self.assertRedirects(self.client.get(url, {'q': '@SARAH'}),
+                             reverse('profile', args=['sarah']))
+        self.assertContains(self.client.get(url, {'q': 'sa'}), '@samuel')
+
+
+class SignUpTest(TestCase):
+
+    # Имя, совпадающее с адресом сайта, закрыло бы профиль
+    def test_reserved_usernames(self):
+        data = {'username': 'rss', 'password1': 'Secret-pass-42',
+                'password2': 'Secret-pass-42'}
+        for username in ('rss', 'Popular', 'notifications'):
+            data['username'] = username
+            response = self.client.post(reverse('signup'), data)
+            self.assertFormError(response, 'form', 'username',
+                                 'Это имя занято адресом сайта.')
+        data['username'] = 'rssfan'
+        self.assertEqual(self.client.post(reverse('signup'), data)
+                         .status_code, 302)
+        self.assertTrue(User.objects.filter(username='rssfan').exists())
@@ -3,5 +3,8 @@ from . import views
 
 urlpatterns = [
     path("signup/", views.SignUp.as_view(), name="signup"),
+    path("usernames/", views.username_suggestions,
+         name="username_suggestions"),
+    path("search/", views.user_search, name="user_search"),
 
 ]
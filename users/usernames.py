@@ -0,0 +1,121 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+User = get_user_model()
+
+SEQ_KEY = "usernames:seq"
+
+
+def event_key(seq):
+    return f"usernames:event:{seq}"
+
+
+def publish(op, username):
+    """Сообщает всем воркерам о новом ("add") или ушедшем ("remove") имени.
+
+    События нумеруются cache.incr и живут в кэше; воркер, отставший
+    больше чем на USERNAME_INDEX_LOG_SIZE событий или потерявший
+    событие при вытеснении, перечитывает имена из БД целиком.
+    """
+    cache.add(SEQ_KEY, 0, None)
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        # счётчик вытеснили между add и incr - пусть все перестроятся
+        cache.set(SEQ_KEY, 1, None)
+        seq = 1
+    cache.set(event_key(seq), (op, username), settings.USERNAME_INDEX_TTL)
+
+
+class UsernameIndex:
+    """Имена активных пользователей в памяти воркера, по префиксу - bisect.
+
+    keys - имена в нижнем регистре по алфавиту, names - те же имена как
+    есть, в том же порядке. Поиск - два bisect и срез, без БД; новые
+    имена приходят событиями из кэша (publish), раз в USERNAME_INDEX_TTL
+    индекс всё равно перечитывается, чтобы подхватить переименования.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = []
+        self.names = []
+        self.seq = None
+        self.loaded_at = 0
+
+    def rebuild(self, seq):
+        names = sorted(User.objects.filter(is_active=True)
+                       .values_list("username", flat=True)
+                       .iterator(), key=str.lower)
+        self.keys = [name.lower() for name in names]
+        self.names = names
+        self.seq = seq
+        self.loaded_at = time.monotonic()
+
+    def find(self, username):
+        """Позиция имени и есть ли оно уже (имена различаются регистром)."""
+        key = username.lower()
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.names[position] == username:
+                return position, True
+            position += 1
+        return position, False
+
+    def add(self, username):
+        position, found = self.find(username)
+        if not found:
+            self.keys.insert(position, username.lower())
+            self.names.insert(position, username)
+
+    def remove(self, username):
+        position, found = self.find(username)
+        if found:
+            del self.keys[position]
+            del self.names[position]
+
+    def fresh(self, seq):
+        return (self.seq == seq and time.monotonic() - self.loaded_at
+                < settings.USERNAME_INDEX_TTL)
+
+    def refresh(self):
+        seq = cache.get(SEQ_KEY) or 0
+        if self.fresh(seq):
+            return
+        with self.lock:
+            # пока ждали замок, индекс мог обновить другой поток
+            if self.fresh(seq):
+                return
+            if (self.seq is None or time.monotonic() - self.loaded_at
+                    >= settings.USERNAME_INDEX_TTL or
+                    not 0 < seq - self.seq <=
+                    settings.USERNAME_INDEX_LOG_SIZE):
+                self.rebuild(seq)
+                return
+            events = cache.get_many([event_key(number) for number in
+                                     range(self.seq + 1, seq + 1)])
+            if len(events) < seq - self.seq:
+                self.rebuild(seq)
+                return
+            for number in range(self.seq + 1, seq + 1):
+                op, username = events[event_key(number)]
+                (self.add if op == "add" else self.remove)(username)
+            self.seq = seq
+
+    def search(self, prefix, limit):
+        """Первые limit имён по алфавиту, начинающихся с prefix."""
+        self.refresh()
+        prefix = prefix.lower()
+        with self.lock:
+            start = bisect_left(self.keys, prefix)
+            end = min(start + limit,
+                      bisect_left(self.keys, prefix + "\uffff"))
+            return self.names[start:end]
+
+
+index = UsernameIndex()
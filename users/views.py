@@ -1,10 +1,36 @@
-from django.views.generic import CreateView
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
+from django.views.generic import CreateView
 
 from .forms import CreationForm
+from .usernames import index
+
+User = get_user_model()
 
 
 class SignUp(CreateView):
     form_class = CreationForm
     success_url = reverse_lazy("login")
     template_name = "signup.html"
+
+
+def username_suggestions(request):
+    """Автодополнение @упоминаний и поиска: имена по префиксу, без БД."""
+    prefix = request.GET.get("q", "").lstrip("@")
+    usernames = (index.search(prefix, settings.USERNAME_SUGGESTIONS)
+                 if prefix else [])
+    return JsonResponse({"usernames": usernames})
+
+
+def user_search(request):
+    query = request.GET.get("q", "").strip().lstrip("@")
+    usernames = (index.search(query, settings.USERNAME_SEARCH_RESULTS)
+                 if query else [])
+    for username in usernames:
+        if username.lower() == query.lower():
+            return redirect("profile", username=username)
+    return render(request, "user_search.html",
+                  {"query": query, "usernames": usernames})
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.flatpages.models import FlatPage
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, HttpResponsePermanentRedirect
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_safe
+
+from posts.edge import edge_cache, invalidate
+from posts.pagecache import fill_holes
+
+GENERATION_KEY = "flatpages:generation"
+
+_lock = threading.Lock()
+# (поколение, {url: FlatPage}) - подменяется целиком
+_pages = (None, {})
+
+
+def generation():
+    """Общее для всех процессов поколение flatpages: меняется при правке."""
+    current = cache.get(GENERATION_KEY)
+    if current is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        current = cache.get(GENERATION_KEY)
+    return current
+
+
+def warm():
+    """Читает все flatpages сайта одним запросом в память процесса."""
+    global _pages
+    current = generation()
+    pages = {page.url: page for page in
+             FlatPage.objects.filter(sites__id=settings.SITE_ID)}
+    with _lock:
+        _pages = (current, pages)
+    return pages
+
+
+def get_flatpage(url):
+    current, pages = _pages
+    if current != generation():
+        pages = warm()
+    return pages.get(url)
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def flatpages_changed(sender, **kwargs):
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+    invalidate("flatpages")
+
+
+@require_safe
+def flatpage(request, url):
+    """flatpages.views.flatpage без запроса к базе на каждый показ.
+
+    Страница берётся из памяти процесса, готовый HTML - из кэша с
+    метками вместо личных фрагментов (см. posts/pagecache.py).
+    Отвечает 304, если ETag у клиента совпадает.
+    """
+    if not url.startswith("/"):
+        url = "/" + url
+    page = get_flatpage(url)
+    if page is None:
+        if not url.endswith("/") and settings.APPEND_SLASH \
+                and get_flatpage(url + "/") is not None:
+            return HttpResponsePermanentRedirect(request.path + "/")
+        raise Http404
+    if page.registration_required and not request.user.is_authenticated:
+        return redirect_to_login(request.path)
+
+    key = (f"flatpage:{generation()}:"
+           + hashlib.md5(url.encode()).hexdigest())
+    content = cache.get(key)
+    if content is None:
+        request.punch_holes = True
+        try:
+            page.title = mark_safe(page.title)
+            page.content = mark_safe(page.content)
+            content = render(request,
+                             page.template_name or "flatpages/default.html",
+                             {"flatpage": page}).content
+        finally:
+            request.punch_holes = False
+        cache.set(key, content, settings.FLATPAGE_CACHE_TIMEOUT)
+
+    content = fill_holes(request, content)
+    etag = '"%s"' % hashlib.md5(content).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content)
+    response["ETag"] = etag
+    return edge_cache(request, response, ["flatpages"])
@@ -0,0 +1,156 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified)
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .static import IMMUTABLE_MAX_AGE, resolve
+from .thumbnails import thumbnail_source
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRange:
+    """Файл, из которого можно прочитать не больше length байт.
+
+    fileno() отдаётся как есть: wsgi.file_wrapper (gunicorn и т.п.) шлёт
+    файл через os.sendfile с текущей позиции на Content-Length байт,
+    а без него FileResponse читает кусками только нужный диапазон.
+    """
+
+    def __init__(self, f, start, length):
+        self.file = f
+        self.remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Разбирает одиночный диапазон Range: (start, end) или None.
+
+    Несколько диапазонов не поддерживаем - тогда отдаём файл целиком.
+    ValueError означает, что диапазон не попадает в файл (ответ 416).
+    """
+    match = RANGE_RE.match(header.replace(" ", ""))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def etag_for(stat):
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def image_referenced(name):
+    from posts.models import ArchivedPost, Post
+    from posts.shards import each_shard
+    return any(queryset.filter(image=name).exists() for queryset in
+               [*each_shard(Post.objects.all()), ArchivedPost.objects.all()])
+
+
+def media_access_allowed(request, path):
+    """Отдаём картинки постов и их миниатюры, остальное - 404.
+
+    Решение по пути кэшируется на MEDIA_ACCESS_CACHE_TIMEOUT секунд,
+    чтобы запрос картинки не стоил двух запросов к базе.
+    """
+    if not path.startswith(tuple(settings.MEDIA_SERVE_PREFIXES)):
+        return False
+    name = thumbnail_source(path) or path
+    if not name.startswith("posts/"):
+        return False
+    key = "media:allowed:" + hashlib.md5(name.encode()).hexdigest()
+    return cache.get_or_set(key, lambda: image_referenced(name),
+                            settings.MEDIA_ACCESS_CACHE_TIMEOUT)
+
+
+def accel_response(path, fullpath):
+    """Отдаёт файл силами фронт-прокси, Django только проверяет доступ."""
+    response = HttpResponse()
+    # пустой Content-Type, чтобы nginx подставил свой по расширению
+    del response["Content-Type"]
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        response["X-Accel-Redirect"] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + path)
+    else:
+        response["X-Sendfile"] = fullpath
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    path, fullpath = resolve(settings.MEDIA_ROOT, path)
+    if not media_access_allowed(request, path):
+        raise Http404
+    cache_control = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX or settings.MEDIA_X_SENDFILE:
+        response = accel_response(path, fullpath)
+        response["Cache-Control"] = cache_control
+        return response
+
+    stat = os.stat(fullpath)
+    etag = etag_for(stat)
+    if etag in request.META.get("HTTP_IF_NONE_MATCH", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return response
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    range_header = request.META.get("HTTP_RANGE")
+    if request.META.get("HTTP_IF_RANGE", etag) != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, stat.st_size) \
+            if range_header else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    f = open(fullpath, "rb")
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type or
+                                "application/octet-stream")
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(FileRange(f, start, length), status=206,
+                                content_type=content_type or
+                                "application/octet-stream")
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Cache-Control"] = cache_control
+    return response
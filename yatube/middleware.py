@@ -0,0 +1,103 @@
+import time
+import zlib
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+
+# уже сжатые форматы: повторное сжатие только тратит CPU
+INCOMPRESSIBLE_TYPES = (
+    "image/", "video/", "audio/", "font/woff",
+    "application/zip", "application/gzip", "application/x-gzip",
+    "application/pdf", "application/octet-stream",
+)
+
+
+def gzip_compressor(level):
+    # wbits=31: deflate в gzip-обёртке, как у gzip.compress
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware с настраиваемым уровнем и ограничением по CPU.
+
+    Время сжатия каждого ответа меряется через process_time и уходит
+    клиенту в Server-Timing. Если ответ сжимался дольше GZIP_CPU_BUDGET_MS,
+    уровень для следующих ответов понижается, а когда запас большой -
+    возвращается обратно к GZIP_LEVEL. Ответы больше GZIP_MAX_BYTES
+    не сжимаются вовсе, потоковые сжимаются по кускам.
+    """
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.level = settings.GZIP_LEVEL
+
+    def should_compress(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return False
+        if response.status_code == 206 or response.has_header("Content-Range"):
+            return False
+        content_type = response.get("Content-Type", "")
+        if content_type.startswith(INCOMPRESSIBLE_TYPES):
+            return False
+        if not response.streaming:
+            size = len(response.content)
+            if size < settings.GZIP_MIN_BYTES or size > settings.GZIP_MAX_BYTES:
+                return False
+        return True
+
+    def account(self, cpu_seconds):
+        budget = settings.GZIP_CPU_BUDGET_MS / 1000
+        if cpu_seconds > budget and self.level > 1:
+            self.level -= 1
+        elif cpu_seconds < budget / 4 and self.level < settings.GZIP_LEVEL:
+            self.level += 1
+
+    def compress_sequence(self, sequence, level):
+        compressor = gzip_compressor(level)
+        spent = 0.0
+        for chunk in sequence:
+            started = time.process_time()
+            data = compressor.compress(chunk)
+            # SYNC_FLUSH отдаёт клиенту всё, что накопилось на этот кусок
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            spent += time.process_time() - started
+            if data:
+                yield data
+        yield compressor.flush()
+        self.account(spent)
+
+    def process_response(self, request, response):
+        if not self.should_compress(request, response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        ae = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if not re_accepts_gzip.search(ae):
+            return response
+
+        level = self.level
+        if response.streaming:
+            response.streaming_content = self.compress_sequence(
+                response.streaming_content, level)
+            del response["Content-Length"]
+        else:
+            started = time.process_time()
+            compressor = gzip_compressor(level)
+            compressed = compressor.compress(response.content)
+            compressed += compressor.flush()
+            spent = time.process_time() - started
+            self.account(spent)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+            response["Server-Timing"] = "gzip;dur=%.2f;desc=\"level %d\"" % (
+                spent * 1000, level)
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = "gzip"
+        return response
@@ -39,10 +39,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'posts.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,6 +63,7 @@ TEMPLATES = [
             "django.template.context_processors.request",
             "django.contrib.auth.context_processors.auth",
             "django.contrib.messages.context_processors.messages",
+            "posts.context_processors.notifications",
             ]
         },
     }
@@ -78,6 +81,7 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
+DATABASE_ROUTERS = ["posts.shards.AuthorShardRouter"]
 
 
 # Password validation
@@ -120,9 +124,34 @@ STATIC_URL = '/static/'
 
 # задаём адрес директории, куда командой *collectstatic* будет собрана вся статика
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# хэшированные имена + .gz/.br рядом, отдаёт yatube.static.serve_static
+STATICFILES_STORAGE = "yatube.storage.CompressedManifestStaticFilesStorage"
+# без записи в манифесте отдавать исходное имя, а не падать; только при
+# разработке: в бою пропущенный файл должен ронять страницу. Берётся
+# DEBUG из этого файла - тестовый раннер выключает DEBUG уже после
+STATIC_MANIFEST_FALLBACK = DEBUG
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# загрузки пишутся во временный файл и не дальше IMAGE_MAX_BYTES
+# (posts/uploads.py) и проверяются по заголовку картинки; целиком её
+# декодирует фоновая задача verify_image
+FILE_UPLOAD_HANDLERS = ["posts.uploads.LimitedUploadHandler"]
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_MAX_WIDTH = 6000
+IMAGE_MAX_HEIGHT = 6000
+IMAGE_MAX_PIXELS = 24000000
+IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+# что из MEDIA_ROOT можно отдавать: картинки постов и миниатюры sorl;
+# миниатюра лежит в каталоге с именем исходника (yatube/thumbnails.py)
+# и доступна, только пока доступен он
+MEDIA_SERVE_PREFIXES = ("posts/", "cache/")
+MEDIA_ACCESS_CACHE_TIMEOUT = 60
+THUMBNAIL_BACKEND = "yatube.thumbnails.SourceNamedBackend"
+# за nginx: internal-location, на который указывает X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = None
+# за Apache/lighttpd с mod_xsendfile
+MEDIA_X_SENDFILE = False
 
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
@@ -130,6 +159,7 @@ LOGIN_REDIRECT_URL = "index"
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+DEFAULT_FROM_EMAIL = "noreply@yatube.ru"
 
 
 SITE_ID = 1
@@ -139,12 +169,107 @@ SITE_ID = 1
 #         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
 #     }
 # }
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    },
+# сессии (cached_db), request.user, версии страниц, вёдра лимитов и события
+# индекса имён должны видеть все воркеры, поэтому в бою кэш общий -
+# memcached. LocMemCache у каждого процесса свой: только для runserver
+# (DEBUG из этого файла, как у STATIC_MANIFEST_FALLBACK)
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': '127.0.0.1:11211',
+        },
+    }
+
+# сжатие ответов, см. yatube/middleware.py
+GZIP_LEVEL = 6
+GZIP_MIN_BYTES = 200
+GZIP_MAX_BYTES = 4 * 1024 * 1024
+GZIP_CPU_BUDGET_MS = 5
+
+# лимиты на запись по имени URL: вёдра на пользователя и на IP,
+# см. posts/ratelimit.py
+RATELIMITS = {
+    "new_post": {"user": "10/m", "ip": "30/m", "methods": ("POST",)},
+    "add_comment": {"user": "30/m", "ip": "90/m", "methods": ("POST",)},
+    "profile_follow": {"user": "60/m", "ip": "180/m"},
+    "profile_unfollow": {"user": "60/m", "ip": "180/m"},
 }
+# включать только за прокси, который сам выставляет X-Forwarded-For
+RATELIMIT_TRUST_X_FORWARDED_FOR = False
+
+# фоновые задачи (posts/jobs.py), выполняет manage.py run_jobs
+JOBS_BATCH_SIZE = 500
+# True - выполнять задачу сразу после коммита, без воркера (для отладки)
+JOBS_RUN_EAGERLY = False
+
+NOTIFICATIONS_CACHE_TIMEOUT = 60 * 5
+# дайджест: сколько свежих постов одного автора попадает в письмо
+DIGEST_POSTS_PER_AUTHOR = 5
+# лента «Популярное» (posts/ranking.py): вес события удваивается
+# каждые POPULAR_HALF_LIFE секунд, в ленте не больше POPULAR_FEED_SIZE
+POPULAR_HALF_LIFE = 60 * 60 * 12
+POPULAR_WEIGHTS = {"post": 1.0, "comment": 1.0, "follow": 2.0}
+POPULAR_FEED_SIZE = 100
+# кэширующий прокси перед анонимами (posts/edge.py): сколько он держит
+# страницу и куда слать очистку по Surrogate-Key; None - прокси нет
+EDGE_CACHE_TTL = 60 * 10
+EDGE_PURGE_URL = None
+EDGE_PURGE_METHOD = "PURGE"
+EDGE_PURGE_BATCH_SIZE = 256
+EDGE_PURGE_TIMEOUT = 2
+# общий кэш целых страниц ленты, см. posts/pagecache.py
+PAGE_CACHE_TIMEOUT = 60 * 5
+# готовый HTML flatpages; правка в админке меняет поколение и ключи
+FLATPAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# RSS/Atom (posts/feeds.py): сколько последних записей в ленте
+FEED_SIZE = 20
+# sitemap (posts/sitemap.py, manage.py build_sitemap): посты режутся на
+# куски по диапазонам id, пересобираются только изменившиеся куски
+SITEMAP_SHARD_SIZE = 50000
+SITEMAP_ROOT = os.path.join(BASE_DIR, "sitemaps")
+SITEMAP_PROTOCOL = "http"
+# шарды постов по автору (posts/shards.py): алиасы из DATABASES, между
+# которыми делятся посты и комментарии; пусто - всё в default.
+# После изменения списка запустить manage.py reshard
+POST_SHARDS = []
+# сколько секунд воркер помнит шард автора; reshard ждёт столько же,
+# прежде чем удалить старые копии
+SHARD_CACHE_TIMEOUT = 60
+# просмотры постов копятся в памяти воркера (posts/counters.py) и пишутся
+# одним UPDATE раз в VIEW_FLUSH_EVERY просмотров или VIEW_FLUSH_INTERVAL
+# секунд; при падении воркера теряется не больше VIEW_FLUSH_EVERY
+VIEW_FLUSH_EVERY = 100
+VIEW_FLUSH_INTERVAL = 10
+# админка: дальше этого числа строк списки не пересчитываются точно
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# сессии живут в кэше, а в БД пишутся насквозь, чтобы пережить его очистку
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+# request.user берётся из кэша, см. users/backends.py; ModelBackend
+# остаётся в списке для сессий, открытых до кэша: без него Django
+# разлогинил бы их, не найдя записанный в сессии бэкенд
+AUTHENTICATION_BACKENDS = [
+    "users.backends.CachedModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+USER_CACHE_TIMEOUT = 60 * 15
+USER_CACHE_VERSION = 1
+# индекс имён для автодополнения (users/usernames.py): сколько имён
+# отдавать, сколько событий из кэша догонять до полной перестройки
+# и как часто перестраивать всё равно
+USERNAME_SUGGESTIONS = 10
+USERNAME_SEARCH_RESULTS = 50
+USERNAME_INDEX_LOG_SIZE = 1000
+USERNAME_INDEX_TTL = 60 * 60
 
 TEST_CACHES = {
     'default': {
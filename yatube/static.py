@@ -0,0 +1,82 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# ManifestStaticFilesStorage вставляет в имя 12 символов md5
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.[^/]+$")
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def resolve(document_root, path):
+    """Нормализует путь и возвращает его вместе с абсолютным путём файла."""
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(document_root, path)
+    except (ValueError, SuspiciousFileOperation):
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return path, fullpath
+
+
+def accepted_encodings(request):
+    header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def pick_variant(request, fullpath):
+    """Возвращает путь к предсжатому варианту и его Content-Encoding."""
+    accepted = accepted_encodings(request)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return fullpath + suffix, encoding
+    return fullpath, None
+
+
+def cache_control(path):
+    if HASHED_NAME_RE.search(path):
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return "public, max-age=60"
+
+
+@require_safe
+def serve_static(request, path, document_root=None):
+    path, fullpath = resolve(document_root or settings.STATIC_ROOT, path)
+    variant, encoding = pick_variant(request, fullpath)
+    stat = os.stat(variant)
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(fullpath)
+        response = FileResponse(open(variant, "rb"),
+                                content_type=content_type or
+                                "application/octet-stream")
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["Cache-Control"] = cache_control(path)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def serve_sitemap(request, path):
+    """sitemap.xml и его куски, собранные manage.py build_sitemap."""
+    return serve_static(request, path, settings.SITEMAP_ROOT)
@@ -0,0 +1,61 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него кладём только .gz
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".map", ".svg", ".json", ".xml", ".txt", ".html",
+    ".ico", ".ttf", ".otf", ".eot",
+)
+
+
+def compress_file(path, min_size=256):
+    """Кладёт рядом с файлом .gz и .br, если они получаются меньше."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < min_size:
+        return []
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data)))
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) >= len(data):
+            continue
+        with open(path + suffix, "wb") as f:
+            f.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Хэширует имена по манифесту и сжимает результат при collectstatic."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(hashed_names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                compress_file(self.path(name))
+
+    def stored_name(self, name):
+        # пока collectstatic не запускали (разработка, тесты), манифеста
+        # нет - отдаём исходное имя вместо ValueError на каждой странице;
+        # в бою manifest_strict работает как есть
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if not settings.STATIC_MANIFEST_FALLBACK:
+                raise
+            return name
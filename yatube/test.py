@@ -0,0 +1,243 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.test import override_settings
+
+from posts.models import Post
+
+from .middleware import CompressionMiddleware
+from .static import serve_static
+from .storage import CompressedManifestStaticFilesStorage, compress_file
+
+STATIC_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(STATIC_ROOT=STATIC_ROOT)
+class StaticServeTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(STATIC_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.name = 'site.0123456789ab.css'
+        self.path = os.path.join(STATIC_ROOT, self.name)
+        with open(self.path, 'w') as f:
+            f.write('body { margin: 0; }\n' * 100)
+        compress_file(self.path)
+
+    # Для хэшированного имени отдаётся .gz и кэш на год
+    def test_serves_precompressed_immutable(self):
+        response = self.client.get(f'/static/{self.name}',
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    # Без Accept-Encoding отдаётся исходный файл
+    def test_serves_identity_without_accept_encoding(self):
+        response = self.client.get(f'/static/{self.name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    # Без записи в манифесте исходное имя - только при разработке
+    def test_manifest_fallback_only_in_development(self):
+        storage = CompressedManifestStaticFilesStorage(location=STATIC_ROOT)
+        with self.settings(STATIC_MANIFEST_FALLBACK=True):
+            self.assertEqual(storage.stored_name('missing.css'),
+                             'missing.css')
+        with self.settings(STATIC_MANIFEST_FALLBACK=False):
+            with self.assertRaises(ValueError):
+                storage.stored_name('missing.css')
+
+    def test_missing_file_and_traversal_are_404(self):
+        request = RequestFactory().get('/static/')
+        for path in ('missing.css', '../settings.py', '/etc/passwd'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    serve_static(request, path)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaServeTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        user = User.objects.create_user(username='sarah')
+        self.post = Post.objects.create(
+            text='Test text', author=user,
+            image=SimpleUploadedFile('pic.png', bytes(range(256)) * 4,
+                                     content_type='image/png'))
+        self.url = f'/media/{self.post.image.name}'
+
+    def test_serves_whole_file_with_cache_headers(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), 1024)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content),
+                         bytes(range(10, 20)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content),
+                         bytes(range(252, 256)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f'/protected/{self.post.image.name}')
+        self.assertEqual(response.content, b'')
+
+    # Файлы вне разрешённых каталогов и не привязанные к посту не отдаём
+    def test_unreferenced_files_are_404(self):
+        os.makedirs(os.path.join(MEDIA_ROOT, 'posts'), exist_ok=True)
+        for name in ('posts/orphan.png', 'secret.txt'):
+            with open(os.path.join(MEDIA_ROOT, name), 'wb') as f:
+                f.write(b'x')
+            with self.subTest(name=name):
+                response = self.client.get(f'/media/{name}')
+                self.assertEqual(response.status_code, 404)
+
+    # Миниатюра доступна, пока доступна её картинка; решение кэшируется
+    def test_thumbnails_follow_source(self):
+        thumbnail = f'cache/{self.post.image.name}/abc.jpg'
+        orphan = 'cache/posts/orphan.png/abc.jpg'
+        for name in (thumbnail, orphan):
+            os.makedirs(os.path.dirname(os.path.join(MEDIA_ROOT, name)),
+                        exist_ok=True)
+            with open(os.path.join(MEDIA_ROOT, name), 'wb') as f:
+                f.write(b'x')
+        self.assertEqual(self.client.get(f'/media/{thumbnail}').status_code,
+                         200)
+        self.assertEqual(self.client.get(f'/media/{orphan}').status_code,
+                         404)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+            self.client.get(f'/media/{thumbnail}')
+
+
+class CompressionMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.body = b'<div class="card">post</div>\n' * 200
+
+    def process(self, response, request=None):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(request or self.request)
+
+    def test_compresses_html_and_sets_vary(self):
+        response = self.process(HttpResponse(self.body))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('gzip;dur=', response['Server-Timing'])
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_streams_large_pages(self):
+        response = self.process(
+            StreamingHttpResponse(iter([self.body] * 10)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response)),
+                         self.body * 10)
+
+    def test_skips_media_and_ranges(self):
+        image = HttpResponse(self.body, content_type='image/png')
+        self.assertFalse(self.process(image).has_header('Content-Encoding'))
+
+        partial = HttpResponse(self.body, status=206)
+        self.assertFalse(self.process(partial).has_header('Content-Encoding'))
+
+    def test_vary_without_accept_encoding(self):
+        response = self.process(HttpResponse(self.body),
+                                RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    # Уровень падает, когда сжатие не укладывается в бюджет CPU
+    @override_settings(GZIP_CPU_BUDGET_MS=0)
+    def test_level_drops_over_cpu_budget(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        middleware.account(0.01)
+        self.assertEqual(middleware.level, 5)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'flatpages-test'}})
+class FlatPageTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.page = FlatPage.objects.create(url='/about-author/',
+                                            title='Об авторе',
+                                            content='<b>Привет</b>')
+        self.page.sites.add(Site.objects.get_current())
+        self.url = '/about-author/'
+
+    # Повторный показ - без запросов к базе, с ответом 304 по ETag
+    def test_cached_and_conditional(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '<b>Привет</b>')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    # Правка в админке сразу видна и меняет ETag
+    def test_invalidated_on_save(self):
+        etag = self.client.get(self.url)['ETag']
+        self.page.content = 'Новый текст'
+        self.page.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый текст')
+
+        self.page.sites.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_user_fragment_is_not_shared(self):
+        self.client.get(self.url)
+        user = User.objects.create_user(username='sarah')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(self.url),
+                            'Пользователь: sarah')
@@ -0,0 +1,25 @@
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.helpers import serialize, tokey
+
+
+class SourceNamedBackend(ThumbnailBackend):
+    """Кладёт миниатюры в каталог с именем исходной картинки.
+
+    cache/posts/pic.png/<ключ>.jpg вместо cache/ab/cd/<ключ>.jpg: по пути
+    миниатюры yatube/media.py находит исходник и пускает к ней только
+    тех, кого пустил бы к нему.
+    """
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        return "%s%s/%s.%s" % (settings.THUMBNAIL_PREFIX, source.name, key,
+                               EXTENSIONS[options["format"]])
+
+
+def thumbnail_source(path):
+    """Имя исходной картинки по пути миниатюры или None."""
+    prefix = settings.THUMBNAIL_PREFIX
+    if not path.startswith(prefix) or path.count("/") < 2:
+        return None
+    return path[len(prefix):].rsplit("/", 1)[0]
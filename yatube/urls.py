@@ -1,23 +1,28 @@
 from django.contrib import admin
-from django.urls import include, path
-from django.contrib.flatpages import views
+from django.urls import include, path, re_path
 from django.conf.urls import handler404, handler500
 from django.conf import settings
-from django.conf.urls.static import static
+
+from .flatpages import flatpage
+from .media import serve_media
+from .static import serve_sitemap, serve_static
 
 urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path("auth/", include("users.urls")),
-    path('about/', include('django.contrib.flatpages.urls')),
-    path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about'),
-    path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='terms'),
+    path('about/<path:url>', flatpage,
+         name='django.contrib.flatpages.views.flatpage'),
+    path('about-author/', flatpage, {'url': '/about-author/'}, name='about'),
+    path('about-spec/', flatpage, {'url': '/about-spec/'}, name='terms'),
     path("admin/", admin.site.urls),
+    re_path(r"^%s(?P<path>.*)$" % settings.STATIC_URL.lstrip("/"),
+            serve_static, name="static"),
+    re_path(r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"),
+            serve_media, name="media"),
+    re_path(r"^(?P<path>sitemap(-\d+)?\.xml)$", serve_sitemap,
+            name="sitemap"),
     path("", include("posts.urls")),
 ]
 
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -5,3 +5,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# flatpages читаются в память процесса заранее, а не первым посетителем
+from django.db import DatabaseError  # noqa: E402
+
+from yatube.flatpages import warm  # noqa: E402
+
+try:
+    warm()
+except DatabaseError:
+    # база ещё не готова (нет миграций) - прочитаем при первом запросе
+    pass